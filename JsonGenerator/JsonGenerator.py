@@ -19,15 +19,28 @@
 
 import sys
 import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "source"))
+
+import daemon
+
+if __name__ == "__main__" and not [arg for arg in sys.argv if arg.startswith(("--serve", "--watch"))]:
+    # If a daemon is running let it do the job, saves on start-up time (see --serve)
+    status = daemon.Forward(sys.argv)
+
+    if status != None:
+        sys.exit(status)
+
 import glob
+import io
+import contextlib
+import concurrent.futures
 
 try:
     import jsonref
 except:
     print("Install jsonref first")
 
-sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "source"))
-
 import logger
 import config
 import code_generator
@@ -36,19 +49,404 @@ import json_loader
 import header_loader
 import trackers
 import rpc_emitter
+import proxystub_generator
+import enum_registry
+
+import ProxyStubGenerator.Cache as Cache
+import ProxyStubGenerator.Watcher as Watcher
 
 NAME = "JsonGenerator"
 
-if __name__ == "__main__":
-    argparser, args = config.Parse(sys.argv)
+def CreateLog(args):
+    # When only listing the outputs keep the output clean for build systems, errors are still reported
+    return logger.Create(NAME, args.verbose, not args.no_warnings and not args.list_outputs, not args.no_style_warnings and not args.list_outputs)
+
+# Options not affecting the content of the generated files
+NON_OUTPUT_OPTIONS = [ "path", "output_dir", "cpp_output_dir", "force", "jobs", "serve", "depfile", "verbose", "cache_dir", "watch", "list_outputs" ]
+
+# Search paths, these only matter through the files found (or not) in them
+SEARCH_PATH_OPTIONS = [ "if_dirs", "cpp_if_dirs", "include_paths" ]
+
+def CreateCache(log, args):
+    directory = args.cache_dir if args.cache_dir else os.environ.get(Cache.CACHE_DIR_ENV)
+
+    # With shared objects or an enum registry the outputs depend on the other source files, too
+    if directory and not args.list_outputs and not args.shared_objects and not args.enum_registry:
+        tool_dirs = [ os.path.dirname(os.path.abspath(__file__)), os.path.dirname(os.path.abspath(code_generator.__file__)),
+                      os.path.dirname(os.path.abspath(Cache.__file__)) ]
+
+        roots = dict([("%s%i" % (option, i), d) for option in SEARCH_PATH_OPTIONS for i, d in enumerate(getattr(args, option))])
+
+        return Cache.Cache(directory, log, tool_dirs, { k: v for k, v in vars(args).items() if k not in NON_OUTPUT_OPTIONS + SEARCH_PATH_OPTIONS }, roots)
+    else:
+        return None
+
+def OutputDirectories(args, path):
+    # Relative output directories are relative to the source file
+    def _Resolve(directory):
+        return os.path.normpath(directory) if directory[0] == os.sep else os.path.join(os.path.dirname(path), os.path.normpath(directory))
+
+    output_path = _Resolve(args.output_dir) if args.output_dir else os.path.dirname(path)
+    cpp_output_path = _Resolve(args.cpp_output_dir) if args.cpp_output_dir else output_path
+
+    return output_path, cpp_output_path
+
+def PreloadFile(args, path, quiet):
+    # Loads a source file as ProcessFile() would and builds the classes of its schemas; the messages of loading
+    # are held back, to be shown when the file is processed, the ones of building the classes are not shown at all
+    # (that's done again when generating the code), so a file producing warnings doesn't report them twice
+    file_log = CreateLog(args)
+    file_log.Header(path)
+    trackers.SetLogger(file_log)
+    json_loader.SetLogger(file_log)
+
+    output = io.StringIO()
+    tree = None
+    loaded = None
+    error = None
+    dependencies = []
+    temp_files = []
+    objects = []
+
+    trackers.enum_tracker.Reset()
+
+    try:
+        with contextlib.redirect_stdout(output):
+            if args.proxystubs and path.endswith(".h"):
+                tree = header_loader.ParseHeader(path, file_log, args.include_paths, dependencies, proxystub_generator.ExtraIncludes(path))
+
+            schemas, additional_includes, temp_files = json_loader.Load(file_log, path, args.if_dirs, args.cpp_if_dirs, args.include_paths, dependencies, tree)
+
+            # Building the classes modifies the documents, keep a copy for generating the code
+            loaded = (json_loader.Resolved(schemas), additional_includes)
+
+        trackers.SetLogger(quiet)
+        json_loader.SetLogger(quiet)
+
+        for schema in schemas:
+            if schema:
+                warnings = config.GENERATED_JSON
+                config.GENERATED_JSON = schema.get("@generated")
+                objects.extend(code_generator.ScanObjects(quiet, schema))
+                config.GENERATED_JSON = warnings
+
+    except (json_loader.JsonParseError, header_loader.CppParseError, IOError, jsonref.JsonRefError) as err:
+        # Reported when the file is processed; an error building the classes is raised again then
+        if not loaded:
+            error = err
+
+    finally:
+        for tf in temp_files:
+            os.remove(tf)
+
+    messages = (output.getvalue(), file_log.errors, file_log.warnings, file_log.infos)
+
+    return (messages, tree, loaded, dependencies, error), objects
+
+def ProcessSharedObjects(log, args, files):
+    # Loads all the source files upfront, to emit the classes they have in common only once (see --shared-objects);
+    # returns the files loaded, to be passed on to ProcessFile(), which reports the problems found loading them
+    output_path, _ = OutputDirectories(args, files[0])
+
+    if args.list_outputs:
+        # Not knowing what the files have in common without loading them, the header is listed as with --keep-empty
+        print(code_generator.SharedHeaderFile(output_path))
+        return dict()
+
+    quiet = logger.Create(NAME, False, False, False)
+    preloaded = dict()
+    objects = []
+
+    try:
+        for path in files:
+            preloaded[path], file_objects = PreloadFile(args, path, quiet)
+            objects.extend([(path, obj) for obj in file_objects])
+    finally:
+        trackers.SetLogger(log)
+        json_loader.SetLogger(log)
+
+    if not os.path.exists(output_path):
+        os.makedirs(output_path, exist_ok=True)
+
+    code_generator.CreateSharedHeader(log, objects, output_path)
+
+    return preloaded
+
+def ProcessFile(log, args, path, cache = None, inputs = None, preloaded = None):
+    # If an inputs list is provided it's filled with all the files the outputs depend on;
+    # with --list-outputs nothing is generated, only the names of the output files are printed;
+    # a file loaded already (see ProcessSharedObjects()) is not loaded again
+    listing = args.list_outputs
+
+    trackers.enum_tracker.Reset()
+
+    temp_files = []
+    dependencies = []
+
+    output_path, cpp_output_path = OutputDirectories(args, path)
+    directories = { "output": output_path, "cpp": cpp_output_path }
+
+    try:
+        log.Header(path)
+
+        if cache:
+            cached = cache.Lookup(path, directories)
+
+            if cached:
+                cached_inputs, outputs, cached_warnings = cached
+
+                for warning in cached_warnings:
+                    log.warnings.append(warning)
+                    print(warning)
+
+                if config.DEPFILE:
+                    for output_file in outputs:
+                        code_generator.WriteDepfile(output_file, cached_inputs)
+
+                log.Success("%i file%s restored from cache" % (len(outputs), "" if len(outputs) == 1 else "s"))
+
+                if inputs != None:
+                    inputs.extend(cached_inputs)
+
+                return temp_files
+
+        errors_before = len(log.errors)
+        warnings_before = len(log.warnings)
+
+        outputs = []
+        tree = None
+
+        if listing:
+            if args.proxystubs and path.endswith(".h"):
+                outputs.append(proxystub_generator.ListOutputs(log, path, cpp_output_path))
+
+            schemas = json_loader.Scan(path, args.if_dirs)
+        else:
+            if preloaded:
+                (output, errors, warnings, infos), tree, loaded, loaded_dependencies, error = preloaded
 
-    log = logger.Create(NAME, args.verbose, not args.no_warnings, not args.no_style_warnings)
+                sys.stdout.write(output)
+                log.errors.extend(errors)
+                log.warnings.extend(warnings)
+                log.infos.extend(infos)
+                dependencies.extend(loaded_dependencies)
+
+                if error and not tree and args.proxystubs and path.endswith(".h"):
+                    raise error
+
+            if args.proxystubs and path.endswith(".h"):
+                # Parse the header only once, for both COM-RPC and JSON-RPC code
+                if not tree:
+                    tree = header_loader.ParseHeader(path, log, args.include_paths, dependencies, proxystub_generator.ExtraIncludes(path))
+
+                if not os.path.exists(cpp_output_path):
+                    os.makedirs(cpp_output_path, exist_ok=True)
+
+                outputs.append(proxystub_generator.Create(log, tree, path, cpp_output_path))
+
+            if preloaded:
+                if error:
+                    raise error
+
+                schemas, additional_includes = loaded
+            else:
+                schemas, additional_includes, temp_files = json_loader.Load(log, path, args.if_dirs, args.cpp_if_dirs, args.include_paths, dependencies, tree)
+
+        joint_headers = {}
+
+        for schema in schemas:
+            trackers.object_tracker.Reset()
+
+            if schema:
+                warnings = config.GENERATED_JSON
+                config.GENERATED_JSON = schema.get("@generated")
+
+                for directory in [output_path, cpp_output_path]:
+                    if directory and not os.path.exists(directory) and not listing:
+                        os.makedirs(directory, exist_ok=True)
+
+                if args.code or args.stubs:
+                    if listing:
+                        headers = code_generator.ListOutputs(schema, path, [output_path, cpp_output_path], args.code, args.stubs, args.code, outputs)
+                    else:
+                        headers = code_generator.Create(log, schema, path, [output_path, cpp_output_path],
+                                        additional_includes, args.code, args.stubs, args.code, dependencies, outputs)
+
+                    name = os.path.basename(path).replace(".h", "").replace(".json", "")
+
+                    if headers:
+                        if name not in joint_headers:
+                            joint_headers[name] = []
+
+                        joint_headers[name].extend(headers)
+
+                if args.docs:
+                    if "$schema" in schema:
+                        if "info" in schema:
+                            title = schema["info"]["title"] if "title" in schema["info"] \
+                                    else schema["info"]["class"] if "class" in schema["info"] \
+                                    else os.path.basename(output_path)
+                        else:
+                            title = os.path.basename(output_path)
+
+                        if listing:
+                            outputs.append(documentation_generator.OutputFile(os.path.join(output_path, title.replace(" ", ""))))
+                        else:
+                            outputs.append(documentation_generator.Create(log, schema, os.path.join(output_path, title.replace(" ", ""))))
+                    else:
+                        log.Warn("Skiping file; not a JSON-RPC definition file")
+
+                config.GENERATED_JSON = warnings
+
+        for n in (joint_headers if not config.NO_API_HEADER else []):
+            if listing:
+                outputs.append(code_generator.ApiHeaderFile(n, output_path))
+            else:
+                outputs.append(code_generator.CreateApiHeader(log, n, output_path, joint_headers[n]))
+
+        if listing:
+            for output_file in outputs:
+                if output_file:
+                    print(output_file)
+        elif config.DEPFILE:
+            for output_file in dict.fromkeys(outputs):
+                if output_file and os.path.exists(output_file):
+                    code_generator.WriteDepfile(output_file, dependencies if dependencies else [path])
+
+        # Runs that failed are not cached, so that the errors are reported again
+        if cache and (len(log.errors) == errors_before):
+            cache.Store(path, dependencies if dependencies else [path], [o for o in outputs if o], directories, log.warnings[warnings_before:])
+
+    except json_loader.JsonParseError as err:
+        log.Error("JSON loader: " + str(err))
+    except header_loader.CppParseError as err:
+        log.Error("Header loader: " + str(err))
+    except documentation_generator.DocumentationError as err:
+        log.Error("Documentation: " + str(err))
+    except rpc_emitter.RPCEmitterError as err:
+        log.Error("RPC emitter: " + str(err))
+    except IOError as err:
+        log.Error(str(err))
+    except jsonref.JsonRefError as err:
+        log.Error(str(err))
+
+    if inputs != None:
+        inputs.extend(dependencies if dependencies else [path])
+
+    return temp_files
+
+def ProcessOutdated(log, args, files, cache, inputs):
+    # A file leaving enum tables to a file processed after it may have to emit these after all (see --enum-registry),
+    # then it's made out of date and processed again here; returns the temporary files created
+    temp_files = []
+
+    if args.enum_registry and args.code and not args.list_outputs:
+        for _ in files:
+            outdated = enum_registry.Outdated(config.ENUM_REGISTRY)
+            again = [path for path in files if os.path.abspath(path) in outdated]
+
+            if not again:
+                break
+
+            for path in again:
+                inputs[path] = []
+                temp_files.extend(ProcessFile(log, args, path, cache, inputs[path]))
+
+    return temp_files
+
+def Watch(args, files, cache, inputs):
+    # Regenerates the outputs of the source files affected by a change, until interrupted
+    log = CreateLog(args)
+    watcher = Watcher.Watcher(log)
+
+    # Keep the parsed C++ trees and JSON documents, only the changed ones will be loaded again
+    header_loader.CppParser.tree_cache = dict()
+    json_loader.document_cache = dict()
+
+    log.Print("Watching %i files for changes, press Ctrl+C to stop..." % len(set(sum(inputs.values(), []))))
+
+    try:
+        while True:
+            changed = watcher.Wait(sum(inputs.values(), []))
+
+            # Start over with a clean log for each round of changes
+            log = CreateLog(args)
+            trackers.SetLogger(log)
+            json_loader.SetLogger(log)
+
+            # A change in any of the files may change what the files have in common, so regenerate all then
+            preloaded = dict()
+
+            if args.shared_objects and args.code:
+                preloaded = ProcessSharedObjects(log, args, files)
+
+            for path in files:
+                if args.shared_objects or [f for f in inputs[path] if os.path.abspath(f) in changed]:
+                    inputs[path] = []
+
+                    for tf in ProcessFile(log, args, path, cache, inputs[path], preloaded.get(path)):
+                        os.remove(tf)
+
+                    # Keep watching the source file itself even if it failed to load
+                    if not inputs[path]:
+                        inputs[path].append(path)
+
+            for tf in ProcessOutdated(log, args, files, cache, inputs):
+                os.remove(tf)
+
+            log.Print("Done, {} error{}.".format(len(log.errors) if log.errors else 'no', '' if len(log.errors) == 1 else 's'))
+
+    except KeyboardInterrupt:
+        pass
+
+# Each job runs in its own process, with its own configuration, trackers, logger and cache statistics
+job_args = None
+job_cache = None
+
+def InitJob(argv, shared_objects):
+    global job_args
+    global job_cache
+    _, job_args = config.Parse(argv)
+    job_cache = CreateCache(None, job_args)
+    trackers.shared_objects.update(shared_objects)
+
+def RunJob(path):
+    log = CreateLog(job_args)
+    trackers.SetLogger(log)
+    json_loader.SetLogger(log)
+
+    if job_cache:
+        job_cache.log = log
+        job_cache.hits = job_cache.misses = 0
+
+    # Capture the output, so it's not interleaved with the output of other jobs
+    output = io.StringIO()
+
+    inputs = []
+
+    with contextlib.redirect_stdout(output):
+        temp_files = ProcessFile(log, job_args, path, job_cache, inputs)
+
+    hits, misses = (job_cache.hits, job_cache.misses) if job_cache else (0, 0)
+
+    return output.getvalue(), log.errors, log.warnings, log.infos, temp_files, hits, misses, inputs
+
+def Main(argv):
+    argparser, args = config.Parse(argv)
+
+    log = CreateLog(args)
     trackers.SetLogger(log)
     json_loader.SetLogger(log)
 
+    if args.serve:
+        # Keep the parsed C++ trees and JSON documents between the runs
+        header_loader.CppParser.tree_cache = dict()
+        json_loader.document_cache = dict()
+        return daemon.Serve(args.serve, Main, log)
+
     temp_files = [] # Track temporary files the procedure may create
 
-    if not args.path or (not args.code and not args.stubs and not args.docs):
+    if not args.path or (not args.code and not args.stubs and not args.docs and not args.proxystubs):
         argparser.print_help()
     else:
         files = []
@@ -60,87 +458,37 @@ if __name__ == "__main__":
             else:
                 files.append(p)
 
-        for path in files:
-
-            trackers.enum_tracker.Reset()
+        cache = CreateCache(log, args)
+        inputs = dict([(path, []) for path in files])
 
-            try:
-                log.Header(path)
+        preloaded = dict()
 
-                schemas, additional_includes, temp_files = json_loader.Load(log, path, args.if_dirs, args.cpp_if_dirs, args.include_paths)
+        if args.shared_objects and args.code and files:
+            preloaded = ProcessSharedObjects(log, args, files)
 
-                joint_headers = {}
+        # The files loaded already are processed here, loading is what takes the most time
+        if (args.jobs > 1) and (len(files) > 1) and not preloaded:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, initializer=InitJob, initargs=(argv, trackers.shared_objects)) as executor:
+                # Results are collected in the order of the input files
+                for path, (output, errors, warnings, infos, job_temp_files, hits, misses, job_inputs) in zip(files, executor.map(RunJob, files)):
+                    sys.stdout.write(output)
+                    inputs[path] = job_inputs
+                    log.errors.extend(errors)
+                    log.warnings.extend(warnings)
+                    log.infos.extend(infos)
+                    temp_files.extend(job_temp_files)
 
-                for schema in schemas:
-                    trackers.object_tracker.Reset()
+                    if cache:
+                        cache.hits += hits
+                        cache.misses += misses
+        else:
+            for path in files:
+                temp_files.extend(ProcessFile(log, args, path, cache, inputs[path], preloaded.get(path)))
 
-                    if schema:
-                        warnings = config.GENERATED_JSON
-                        config.GENERATED_JSON = schema.get("@generated")
-
-                        if args.output_dir:
-                            if (args.output_dir[0]) == os.sep:
-                                output_path = os.path.normpath(args.output_dir)
-                            else:
-                                output_path = os.path.join(os.path.dirname(path), os.path.normpath(args.output_dir))
-
-                            if not os.path.exists(output_path):
-                                os.makedirs(output_path)
-                        else:
-                            output_path = os.path.dirname(path)
+        temp_files.extend(ProcessOutdated(log, args, files, cache, inputs))
 
-                        if args.cpp_output_dir:
-                            if (args.cpp_output_dir[0]) == os.sep:
-                                cpp_output_path = os.path.normpath(args.cpp_output_dir)
-                            else:
-                                cpp_output_path = os.path.join(os.path.dirname(path), os.path.normpath(args.cpp_output_dir))
-
-                            if not os.path.exists(cpp_output_path):
-                                os.makedirs(cpp_output_path)
-                        else:
-                            cpp_output_path = output_path
-
-                        if args.code or args.stubs:
-                            headers = code_generator.Create(log, schema, path, [output_path, cpp_output_path], additional_includes, args.code, args.stubs, args.code)
-
-                            name = os.path.basename(path).replace(".h", "").replace(".json", "")
-
-                            if headers:
-                                if name not in joint_headers:
-                                    joint_headers[name] = []
-
-                                joint_headers[name].extend(headers)
-
-                        if args.docs:
-                            if "$schema" in schema:
-                                if "info" in schema:
-                                    title = schema["info"]["title"] if "title" in schema["info"] \
-                                            else schema["info"]["class"] if "class" in schema["info"] \
-                                            else os.path.basename(output_path)
-                                else:
-                                    title = os.path.basename(output_path)
-
-                                documentation_generator.Create(log, schema, os.path.join(output_path, title.replace(" ", "")))
-                            else:
-                                log.Warn("Skiping file; not a JSON-RPC definition file")
-
-                        config.GENERATED_JSON = warnings
-
-                for n in joint_headers:
-                    code_generator.CreateApiHeader(log, n, output_path, joint_headers[n])
-
-            except json_loader.JsonParseError as err:
-                log.Error("JSON loader: " + str(err))
-            except header_loader.CppParseError as err:
-                log.Error("Header loader: " + str(err))
-            except documentation_generator.DocumentationError as err:
-                log.Error("Documentation: " + str(err))
-            except rpc_emitter.RPCEmitterError as err:
-                log.Error("RPC emitter: " + str(err))
-            except IOError as err:
-                log.Error(str(err))
-            except jsonref.JsonRefError as err:
-                log.Error(str(err))
+        if cache:
+            log.Print("Cache: %s" % cache.Statistics())
 
         log.Info("JsonGenerator: All done, {} files parsed, {} error{}.".format(len(files),
                     len(log.errors) if log.errors else 'no', '' if len(log.errors) == 1 else 's'))
@@ -149,6 +497,11 @@ if __name__ == "__main__":
         for tf in temp_files:
             os.remove(tf)
 
-        # Set error code for shell
-        if log.errors:
-            sys.exit(1)
+        if args.watch:
+            Watch(args, files, cache, inputs)
+
+    # Set error code for shell
+    return (1 if log.errors else 0)
+
+if __name__ == "__main__":
+    sys.exit(Main(sys.argv))
@@ -133,19 +133,25 @@ class Restrictions:
         elif test_set and self.__json and not IsObjectOptional(relay):
             self.__cond.append("(%s.IsSet() == %s)" % (name, self.__comp[2]))
 
-def ProcessEnums(log, action=None):
+def ProcessEnums(log, action=None, registry=None):
+    # With a registry the C++ enums already registered by another file are left out (see --enum-registry)
     count = 0
 
     for obj in trackers.enum_tracker.objects:
         if not obj.is_duplicate and not obj.included_from and ("@register" not in obj.schema or obj.schema["@register"]):
             obj.schema["@register"] = False
+
+            if registry and obj.original_type and not registry.Claim(obj.original_type):
+                log.Info("Enum conversion table for '%s' is emitted in %s" % (obj.original_type, os.path.basename(registry.Owner(obj.original_type))))
+                continue
+
             count += 1
             if action:
                 action(log, obj)
 
     return count
 
-def EmitEnumRegs(log, root, emit, header_file, if_file):
+def EmitEnumRegs(log, root, emit, header_file, if_file, registry=None):
     def _EmitEnumRegistration(log, enum):
         name = enum.original_type if enum.original_type else (Scoped(root, enum) + enum.cpp_class)
 
@@ -180,27 +186,50 @@ def EmitEnumRegs(log, root, emit, header_file, if_file):
     emit.Line()
     emit.Line("namespace %s {" % config.FRAMEWORK_NAMESPACE)
 
-    count = ProcessEnums(log, _EmitEnumRegistration)
+    count = ProcessEnums(log, _EmitEnumRegistration, registry)
 
     emit.Line()
     emit.Line("}")
 
     return count
 
-def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = False):
+def EmitSharedObjects(log, objects, emit):
+    # Emits the classes found in several source files only once, into a header of their own (see --shared-objects)
+    return EmitObjects(log, None, emit, None, [], shared=objects)
+
+def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = False, impl = None, header_file = None, forward = None, shared = None):
+    # If an implementation emitter is given the member functions are only declared in the classes
+    # and defined out of line in there, so that including the header is cheaper (see --out-of-line-data);
+    # if a forward emitter is given the namespace-level classes and enums are also declared in there (see --forward-headers);
+    # if shared objects are given only these are emitted, into the shared namespace (see --shared-objects)
     global emittedItems
+    global emittedDefinitions
+    global emittedDeclarations
     emittedItems = 0
+    emittedDefinitions = 0
+    emittedDeclarations = 0
+
+    scope = [] # classes being emitted, outermost first
 
     def _EmitEnumConversionHandler(root, enum):
         name = enum.original_type if enum.original_type else (Scoped(root, enum) + enum.cpp_class)
         emit.Line("ENUM_CONVERSION_HANDLER(%s)" % name)
 
+    def _EmitForwardDeclaration(declaration):
+        # Only the namespace-level ones, nested classes and enums can't be forward declared
+        if forward and not scope:
+            global emittedDeclarations
+            emittedDeclarations += 1
+            forward.Line(declaration + ";")
+
     def _EmitEnum(enum):
         global emittedItems
         emittedItems += 1
 
         log.Info("Emitting enum '{}'".format(enum.cpp_class))
 
+        _EmitForwardDeclaration("enum%s %s : uint%i_t" % (" class" if enum.is_scoped else "", enum.cpp_class, enum.size))
+
         if enum.description:
             emit.Line("// " + enum.description.split("\n", 1)[0])
 
@@ -217,59 +246,85 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
         emit.Line()
 
     def _EmitClass(json_obj, allow_duplicates=False):
-        def __EmitInit(json_obj):
+        def __EmitFunction(signature, body, return_type="", return_self=False):
+            # Emits a member function inline, or only declares it and emits the definition
+            # into the implementation file if one is being generated (see --out-of-line-data)
+            if return_self:
+                return_type = json_obj.cpp_class + "&"
+
+            _return_type = (return_type + " ") if return_type else ""
+
+            if impl:
+                global emittedDefinitions
+                emittedDefinitions += 1
+
+                _qualified = "::".join(scope)
+
+                if return_self:
+                    _return_type = _qualified + "& "
+
+                emit.Line("%s%s;" % (_return_type, signature))
+
+                impl.Line("%s%s::%s" % (_return_type, _qualified, signature))
+                body(impl)
+                impl.Line()
+            else:
+                emit.Line("%s%s" % (_return_type, signature))
+                body(emit)
+
+        def __EmitInit(out, json_obj):
             for prop in json_obj.properties:
-                emit.Line("Add(%s, &%s);" % (Tstring(prop.json_name), prop.cpp_name))
+                out.Line("Add(%s, &%s);" % (Tstring(prop.json_name), prop.cpp_name))
                 if isinstance(prop, JsonString) and prop.schema.get("opaque"):
-                    emit.Line("%s.SetQuoted(false);" % prop.cpp_name)
+                    out.Line("%s.SetQuoted(false);" % prop.cpp_name)
 
-        def __EmitAssignment(json_obj, other, type, optional_type=False):
+        def __EmitAssignment(out, json_obj, other, type, optional_type=False):
             _move = (type == "move")
 
             if optional_type and not _move:
-                emit.Line("if (%s.IsSet() == true) {" % other)
-                emit.Indent()
+                out.Line("if (%s.IsSet() == true) {" % other)
+                out.Indent()
                 other += ".Value()"
 
             for prop in json_obj.properties:
                 _prop_name = (prop.actual_name if type == "conv" else prop.cpp_name)
 
                 if _move:
-                    emit.Line("%s = std::move(%s.%s);" % (prop.cpp_name, other, _prop_name + prop.convert_rhs))
+                    out.Line("%s = std::move(%s.%s);" % (prop.cpp_name, other, _prop_name + prop.convert_rhs))
                 else:
                     _optional_or_opaque = IsObjectOptionalOrOpaque(prop)
 
                     if (prop.optional and not prop.default_value):
-                        emit.Line("if (%s.%s.IsSet() == true) {" % (other, prop.actual_name))
-                        emit.Indent()
+                        out.Line("if (%s.%s.IsSet() == true) {" % (other, prop.actual_name))
+                        out.Indent()
 
                     elif _optional_or_opaque:
                         if isinstance(prop, JsonString):
-                            emit.Line("if (%s.%s%s.empty() == false) {" % (other, _prop_name, ".Value()" if type != "conv" else ""))
-                            emit.Indent()
+                            out.Line("if (%s.%s%s.empty() == false) {" % (other, _prop_name, ".Value()" if type != "conv" else ""))
+                            out.Indent()
                         elif isinstance(prop, JsonInteger):
-                            emit.Line("if (%s.%s != 0) {" % (other, _prop_name))
-                            emit.Indent()
+                            out.Line("if (%s.%s != 0) {" % (other, _prop_name))
+                            out.Indent()
                         else:
                             _optional_or_opaque = False # invalid @optional...
 
                     if isinstance(prop, JsonArray) and type == "conv" and prop.schema.get("@arraysize"):
-                        emit.Line("%s.Clear();" % prop.cpp_name)
-                        emit.Line("for (uint16_t i = 0; i < %s; i++) {" % (prop.schema.get("@arraysize")))
-                        emit.Indent()
-                        emit.Line("%s.Add() = %s.%s[i];" % (prop.cpp_name, other, _prop_name + prop.convert_rhs))
-                        emit.Unindent()
-                        emit.Line("}")
+                        out.Line("%s.Clear();" % prop.cpp_name)
+                        out.Line("for (uint16_t i = 0; i < %s; i++) {" % (prop.schema.get("@arraysize")))
+                        out.Indent()
+                        out.Line("%s.Add() = %s.%s[i];" % (prop.cpp_name, other, _prop_name + prop.convert_rhs))
+                        out.Unindent()
+                        out.Line("}")
                     else:
-                        emit.Line("%s = %s.%s;" % (prop.cpp_name, other, _prop_name + prop.convert_rhs))
+                        out.Line("%s = %s.%s;" % (prop.cpp_name, other, _prop_name + prop.convert_rhs))
 
                     if (prop.optional and not prop.default_value) or _optional_or_opaque:
-                        emit.Unindent()
-                        emit.Line("}")
+                        out.Unindent()
+                        out.Line("}")
 
             if optional_type and not _move:
-                emit.Unindent()
-                emit.Line("}")
+                out.Unindent()
+                out.Line("}")
 
         def __EmitCtor(json_obj, type, no_init_code=False, optional_type=False, delete=False):
             _other = " _other" if not delete else ""
@@ -277,44 +332,49 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
 
             if type == "copy":
                 assert not optional_type
-                emit.Line("%s(const %s&%s)%s" % (json_obj.cpp_class, json_obj.cpp_class, _other, _delete_str))
+                signature = "%s(const %s&%s)" % (json_obj.cpp_class, json_obj.cpp_class, _other)
             elif type == "move":
                 assert not optional_type
-                emit.Line("%s(%s&&%s)%s" % (json_obj.cpp_class, json_obj.cpp_class, _other, _delete_str))
+                signature = "%s(%s&&%s)" % (json_obj.cpp_class, json_obj.cpp_class, _other)
             elif type == "conv":
                 assert not delete
-                emit.Line("%s(const %s&%s)" % (json_obj.cpp_class, json_obj.cpp_native_type_opt_v(optional_type), _other))
+                signature = "%s(const %s&%s)" % (json_obj.cpp_class, json_obj.cpp_native_type_opt_v(optional_type), _other)
             else:
                 assert not delete
                 assert not optional_type
-                emit.Line("%s()" % (json_obj.cpp_class))
+                signature = "%s()" % (json_obj.cpp_class)
 
-            if not delete:
-                emit.Indent()
-                emit.Line(": %s()" % CoreJson("Container"))
+            def _Body(out):
+                out.Indent()
+                out.Line(": %s()" % CoreJson("Container"))
 
                 for prop in json_obj.properties:
                     if type == "copy":
-                        emit.Line(", %s(%s.%s)" % (prop.cpp_name, _other.strip(), prop.cpp_name))
+                        out.Line(", %s(%s.%s)" % (prop.cpp_name, _other.strip(), prop.cpp_name))
                     elif type == "move":
-                        emit.Line(", %s(std::move(%s.%s))" % (prop.cpp_name, _other.strip(), prop.cpp_name))
+                        out.Line(", %s(std::move(%s.%s))" % (prop.cpp_name, _other.strip(), prop.cpp_name))
                     elif prop.default_value:
-                        emit.Line(", %s(%s)" % (prop.cpp_name, prop.default_value))
+                        out.Line(", %s(%s)" % (prop.cpp_name, prop.default_value))
 
-                emit.Unindent()
-                emit.Line("{")
-                emit.Indent()
+                out.Unindent()
+                out.Line("{")
+                out.Indent()
 
                 if type == "conv":
-                    __EmitAssignment(json_obj, _other.strip(), type, optional_type)
+                    __EmitAssignment(out, json_obj, _other.strip(), type, optional_type)
 
                 if no_init_code:
-                    emit.Line("_Init();")
+                    out.Line("_Init();")
                 else:
-                    __EmitInit(json_obj)
+                    __EmitInit(out, json_obj)
 
-                emit.Unindent()
-                emit.Line("}")
+                out.Unindent()
+                out.Line("}")
+
+            if delete:
+                emit.Line(signature + _delete_str)
+            else:
+                __EmitFunction(signature, _Body)
 
         def __EmitAssignmentOperator(json_obj, type, optional_type=False, delete=False):
             _other = " _rhs" if not delete else ""
@@ -322,61 +382,68 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
 
             if type == "copy":
                 assert not optional_type
-                emit.Line("%s& operator=(const %s&%s)%s" % (json_obj.cpp_class, json_obj.cpp_class, _other, _delete_str))
+                signature = "operator=(const %s&%s)" % (json_obj.cpp_class, _other)
             elif type == "move":
                 assert not optional_type
-                emit.Line("%s& operator=(%s&&%s)%s" % (json_obj.cpp_class, json_obj.cpp_class, _other, _delete_str))
+                signature = "operator=(%s&&%s)" % (json_obj.cpp_class, _other)
             elif type == "conv":
                 assert not delete
-                emit.Line("%s& operator=(const %s&%s)" % (json_obj.cpp_class, json_obj.cpp_native_type_opt_v(optional_type), _other))
+                signature = "operator=(const %s&%s)" % (json_obj.cpp_native_type_opt_v(optional_type), _other)
             else:
                 assert False
 
-            if not delete:
-                emit.Line("{")
-                emit.Indent()
+            def _Body(out):
+                out.Line("{")
+                out.Indent()
 
-                __EmitAssignment(json_obj, _other[1:], type, optional_type)
+                __EmitAssignment(out, json_obj, _other[1:], type, optional_type)
 
-                emit.Line("return (*this);")
-                emit.Unindent()
-                emit.Line("}")
+                out.Line("return (*this);")
+                out.Unindent()
+                out.Line("}")
 
-        def _EmitConversionOperator(json_obj):
-            emit.Line("operator %s() const" % (json_obj.cpp_native_type))
-            emit.Line("{")
-            emit.Indent();
-            emit.Line("%s _value{};" % (json_obj.cpp_native_type))
+            if delete:
+                emit.Line("%s& %s%s" % (json_obj.cpp_class, signature, _delete_str))
+            else:
+                __EmitFunction(signature, _Body, return_self=True)
 
-            for prop in json_obj.properties:
-                if (prop.optional and not prop.default_value):
-                    emit.Line("if (%s.IsSet() == true) {" % (prop.cpp_name))
-                    emit.Indent()
+        def _EmitConversionOperator(json_obj):
+            def _Body(out):
+                out.Line("{")
+                out.Indent();
+                out.Line("%s _value{};" % (json_obj.cpp_native_type))
 
-                conv = (prop.convert if prop.convert else "%s = %s")
+                for prop in json_obj.properties:
+                    if (prop.optional and not prop.default_value):
+                        out.Line("if (%s.IsSet() == true) {" % (prop.cpp_name))
+                        out.Indent()
+
+                    conv = (prop.convert if prop.convert else "%s = %s")
+
+                    if isinstance(prop, JsonArray) and prop.schema.get("@arraysize"):
+                        out.Line("{")
+                        out.Indent()
+                        out.Line("uint16_t i = 0;")
+                        out.Line("auto it = %s.Elements();" % prop.cpp_name)
+                        out.Line("while ((it.Next() != true) && (i < %s)) {" % prop.schema.get("@arraysize"))
+                        out.Indent()
+                        out.Line("%s[i++] = it.Current();" % ("_value." + prop.actual_name))
+                        out.Unindent()
+                        out.Line("}")
+                        out.Unindent()
+                        out.Line("}")
+                    else:
+                        out.Line((conv + ";") % ( ("_value." + prop.actual_name), prop.cpp_name))
 
-                if isinstance(prop, JsonArray) and prop.schema.get("@arraysize"):
-                    emit.Line("{")
-                    emit.Indent()
-                    emit.Line("uint16_t i = 0;")
-                    emit.Line("auto it = %s.Elements();" % prop.cpp_name)
-                    emit.Line("while ((it.Next() != true) && (i < %s)) {" % prop.schema.get("@arraysize"))
-                    emit.Indent()
-                    emit.Line("%s[i++] = it.Current();" % ("_value." + prop.actual_name))
-                    emit.Unindent()
-                    emit.Line("}")
-                    emit.Unindent()
-                    emit.Line("}")
-                else:
-                    emit.Line((conv + ";") % ( ("_value." + prop.actual_name), prop.cpp_name))
+                    if (prop.optional and not prop.default_value):
+                        out.Unindent()
+                        out.Line("}")
 
-                if (prop.optional and not prop.default_value):
-                    emit.Unindent()
-                    emit.Line("}")
+                out.Line("return (_value);")
+                out.Unindent()
+                out.Line("}")
 
-            emit.Line("return (_value);")
-            emit.Unindent()
-            emit.Line("}")
+            __EmitFunction("operator %s() const" % (json_obj.cpp_native_type), _Body)
 
         def _EmitCtor(json_obj, no_init=False):
             __EmitCtor(json_obj, "default", no_init)
@@ -400,23 +467,25 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
             __EmitAssignmentOperator(json_obj, "conv", optional_type)
 
         def _EmitValidator(json_obj):
-            emit.Line()
-            emit.Unindent()
-            emit.Line("public:")
-            emit.Indent()
-            emit.Line("bool IsDataValid() const")
-            emit.Line("{")
-            emit.Indent()
+            def _Body(out):
+                out.Line("{")
+                out.Indent()
 
-            restrictions = Restrictions(test_set=True, reverse=True)
+                restrictions = Restrictions(test_set=True, reverse=True)
 
-            for prop in json_obj.properties:
-                restrictions.append(prop, override=prop.cpp_name)
+                for prop in json_obj.properties:
+                    restrictions.append(prop, override=prop.cpp_name)
 
-            emit.Line("return (%s);" % restrictions.join())
+                out.Line("return (%s);" % restrictions.join())
 
+                out.Unindent()
+                out.Line("}")
+
+            emit.Line()
             emit.Unindent()
-            emit.Line("}")
+            emit.Line("public:")
+            emit.Indent()
+            __EmitFunction("IsDataValid() const", _Body, "bool")
 
         # Bail out if a duplicated class!
         if isinstance(json_obj, JsonObject) and not json_obj.properties:
@@ -425,9 +494,15 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
         if json_obj.is_duplicate or (not allow_duplicates and json_obj.RefCount() > 1):
             return
 
+        if isinstance(json_obj, JsonObject) and json_obj.shared_class:
+            return
+
         if not isinstance(json_obj, (JsonRpcSchema, JsonMethod)):
             log.Info("Emitting class '{}' (source: '{}')".format(json_obj.cpp_class, json_obj.print_name))
 
+            _EmitForwardDeclaration("class %s" % json_obj.cpp_class)
+            scope.append(json_obj.cpp_class)
+
             emit.Line("class %s : public %s {" % (json_obj.cpp_class, CoreJson("Container")))
             emit.Line("public:")
 
@@ -452,9 +527,12 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
 
             emittedItems += 1
 
-            _EmitCtor(json_obj, (json_obj.is_copy_ctor_needed or json_obj.original_type))
+            # The shared classes don't know how they're used, so are always copyable
+            copyable = (json_obj.is_copy_ctor_needed or json_obj.original_type or (shared != None))
+
+            _EmitCtor(json_obj, copyable)
 
-            if json_obj.is_copy_ctor_needed or json_obj.original_type:
+            if copyable:
                 emit.Line()
                 _EmitCopyCtor(json_obj)
                 emit.Line()
@@ -472,7 +550,7 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
                     emit.Line()
                     _EmitConvertCtor(json_obj, optional_type=True)
 
-            if json_obj.is_copy_ctor_needed or json_obj.original_type:
+            if copyable:
                 emit.Line()
                 _EmitCopyAssignmentOperator(json_obj)
                 emit.Line()
@@ -503,17 +581,20 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
 
             _EmitValidator(json_obj)
 
-            if json_obj.is_copy_ctor_needed or json_obj.original_type:
+            if copyable:
                 emit.Unindent()
                 emit.Line()
                 emit.Line("private:")
                 emit.Indent()
-                emit.Line("void _Init()")
-                emit.Line("{")
-                emit.Indent()
-                __EmitInit(json_obj)
-                emit.Unindent()
-                emit.Line("}")
+
+                def _Body(out):
+                    out.Line("{")
+                    out.Indent()
+                    __EmitInit(out, json_obj)
+                    out.Unindent()
+                    out.Line("}")
+
+                __EmitFunction("_Init()", _Body, "void")
 
             emit.Unindent()
             emit.Line()
@@ -528,6 +609,8 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
             emit.Line("}; // class %s" % json_obj.cpp_class)
             emit.Line()
 
+            scope.pop()
+
     count = 0
 
     if trackers.enum_tracker.objects:
@@ -536,20 +619,85 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
             if obj.do_create and not obj.is_duplicate and not obj.included_from:
                 count += 1
 
-    def _EmitNoPushWarnings(prologue = True):
+    def _EmitNoPushWarnings(prologue = True, out = emit):
         if prologue:
             if not config.NO_PUSH_WARNING:
-                emit.Line("PUSH_WARNING(DISABLE_WARNING_TYPE_LIMITS)")
-                emit.Line()
+                out.Line("PUSH_WARNING(DISABLE_WARNING_TYPE_LIMITS)")
+                out.Line()
             else:
-                emit.Line("#if defined(__GNUC__) || defined(__clang__)")
-                emit.Line('#pragma GCC diagnostic ignored "-Wtype-limits"')
-                emit.Line("#endif")
-                emit.Line()
+                out.Line("#if defined(__GNUC__) || defined(__clang__)")
+                out.Line('#pragma GCC diagnostic ignored "-Wtype-limits"')
+                out.Line("#endif")
+                out.Line()
         else:
             if not config.NO_PUSH_WARNING:
-                emit.Line("POP_WARNING()")
-                emit.Line()
+                out.Line("POP_WARNING()")
+                out.Line()
+
+    def _EmitNamespaces(out, prologue = True, push_warnings = True, framework_scope = None):
+        # Opens or closes the namespaces of the classes, in the header, the implementation and the forward files alike;
+        # framework_scope emits what goes after the data namespace when closing (e.g. the enum conversion handlers)
+        if shared != None:
+            namespaces = [config.SHARED_OBJECTS]
+        else:
+            namespaces = [root.schema["info"]["namespace"]] if "info" in root.schema and "namespace" in root.schema["info"] else []
+            namespaces.append(root.json_name)
+
+        if prologue:
+            out.Line("namespace %s {" % config.FRAMEWORK_NAMESPACE)
+            out.Line()
+            out.Line("namespace %s {" % config.DATA_NAMESPACE)
+            out.Indent()
+            out.Line()
+
+            if push_warnings:
+                _EmitNoPushWarnings(True, out)
+
+            for ns in namespaces:
+                out.Line("namespace %s {" % ns)
+                out.Indent()
+                out.Line()
+        else:
+            for ns in reversed(namespaces):
+                out.Unindent()
+                out.Line("} // namespace %s" % ns)
+                out.Line()
+
+            if push_warnings:
+                _EmitNoPushWarnings(False, out)
+
+            out.Unindent()
+            out.Line("} // namespace %s" % config.DATA_NAMESPACE)
+            out.Line()
+
+            if framework_scope:
+                framework_scope()
+
+            out.Line()
+            out.Line("}")
+            out.Line()
+
+    if shared != None:
+        emit.Line()
+        emit.Line("// C++ classes shared by several JSON-RPC APIs.")
+        emit.Line("// Generated automatically. DO NOT EDIT.")
+        emit.Line()
+        emit.Line("// Note: This code is inherently not thread safe. If required, proper synchronisation must be added.")
+        emit.Line()
+        emit.Line("#pragma once")
+        emit.Line()
+        emit.Line("#include <core/JSON.h>")
+        emit.Line()
+        _EmitNamespaces(emit)
+
+        for obj in trackers.SortByDependency(shared):
+            _EmitClass(obj, True)
+
+        _EmitNamespaces(emit, False)
+
+        return emittedItems
+
+    uses_shared = [obj for obj in trackers.object_tracker.objects if obj.shared_class]
 
     emit.Line()
     emit.Line("// C++ classes for %s JSON-RPC API." % root.info["title"].replace("Plugin", "").strip())
@@ -569,25 +717,36 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
         for ai in additional_includes:
             emit.Line("#include <%s%s>" % (config.CPP_INTERFACE_PATH, os.path.basename(ai)))
 
+    if uses_shared:
+        emit.Line("#include \"%s_%s.h\"" % (config.DATA_NAMESPACE, config.SHARED_OBJECTS))
+        emittedItems += 1
+
     if count:
         emit.Line("#include <core/Enumerate.h>")
 
-    emit.Line()
-    emit.Line("namespace %s {" % config.FRAMEWORK_NAMESPACE)
-    emit.Line()
-    emit.Line("namespace %s {" % config.DATA_NAMESPACE)
-    emit.Indent()
-    emit.Line()
-    _EmitNoPushWarnings()
-
-    if "info" in root.schema and "namespace" in root.schema["info"]:
-        emit.Line("namespace %s {" % root.schema["info"]["namespace"])
-        emit.Indent()
-        emit.Line()
+    if impl:
+        impl.Line()
+        impl.Line("// C++ class implementations for %s JSON-RPC API." % root.info["title"].replace("Plugin", "").strip())
+        impl.Line("// Generated automatically from '%s'. DO NOT EDIT." % os.path.basename(if_file))
+        impl.Line()
+        impl.Line("#include \"definitions.h\"")
+        impl.Line("#include \"%s\"" % os.path.basename(header_file))
+        impl.Line()
+        _EmitNamespaces(impl)
+
+    if forward:
+        forward.Line()
+        forward.Line("// Forward declarations of C++ classes for %s JSON-RPC API." % root.info["title"].replace("Plugin", "").strip())
+        forward.Line("// Generated automatically from '%s'. DO NOT EDIT." % os.path.basename(if_file))
+        forward.Line()
+        forward.Line("#pragma once")
+        forward.Line()
+        forward.Line("#include <cstdint>")
+        forward.Line()
+        _EmitNamespaces(forward, push_warnings=False)
 
-    emit.Line("namespace %s {" % root.json_name)
-    emit.Indent()
     emit.Line()
+    _EmitNamespaces(emit)
 
     if emitCommon and trackers.enum_tracker.CommonObjects():
         log.Info("Emitting common enums...")
@@ -605,7 +764,7 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
         log.Info("Emitting common classes...")
         emittedPrologue = False
         for obj in trackers.object_tracker.CommonObjects():
-            if not obj.included_from:
+            if not obj.included_from and not obj.shared_class:
                 if not emittedPrologue:
                     emit.Line("// Common classes")
                     emit.Line("//")
@@ -620,33 +779,26 @@ def EmitObjects(log, root, emit, if_file, additional_includes, emitCommon = Fals
         emit.Line()
         _EmitClass(root)
 
-    emit.Unindent()
-    emit.Line("} // namespace %s" % root.json_name)
-    emit.Line()
-
-    if "info" in root.schema and "namespace" in root.schema["info"]:
-        emit.Unindent()
-        emit.Line("} // namespace %s" % root.schema["info"]["namespace"])
-        emit.Line()
+    def _EmitEnumConversionHandlers():
+        global emittedItems
+        emittedPrologue = False
 
-    _EmitNoPushWarnings(False)
+        for obj in trackers.enum_tracker.objects:
+            if not obj.is_duplicate and not obj.included_from:
+                if not emittedPrologue:
+                    emit.Line("// Enum conversion handlers")
+                    emittedPrologue = True
 
-    emit.Unindent()
-    emit.Line("} // namespace %s" % config.DATA_NAMESPACE)
-    emit.Line()
-    emittedPrologue = False
+                _EmitEnumConversionHandler(root, obj)
+                emittedItems += 1
 
-    for obj in trackers.enum_tracker.objects:
-        if not obj.is_duplicate and not obj.included_from:
-            if not emittedPrologue:
-                emit.Line("// Enum conversion handlers")
-                emittedPrologue = True
+    _EmitNamespaces(emit, False, framework_scope=_EmitEnumConversionHandlers)
 
-            _EmitEnumConversionHandler(root, obj)
-            emittedItems += 1
+    if impl:
+        _EmitNamespaces(impl, False)
 
-    emit.Line()
-    emit.Line("}")
-    emit.Line()
+    if forward:
+        forward.Line()
+        _EmitNamespaces(forward, False, push_warnings=False)
 
     return emittedItems
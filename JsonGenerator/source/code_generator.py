@@ -16,9 +16,11 @@
 # limitations under the License.
 
 import os
+import contextlib
 
 import config
 import trackers
+import enum_registry
 import stub_emitter
 import rpc_emitter
 import class_emitter
@@ -26,10 +28,24 @@ import class_emitter
 from emitter import Emitter
 from json_loader import *
 
+def WriteDepfile(output_file, inputs):
+    # Make/Ninja style dependency file, so that only the affected outputs get rebuilt;
+    # files looked for but not found can't be listed, their directory changes when they appear though
+    def _Escape(f):
+        return f.replace(" ", "\\ ")
+
+    files = dict.fromkeys([(f if os.path.exists(f) else os.path.dirname(os.path.abspath(f))) for f in inputs])
+
+    with open(output_file + ".d", "w") as depfile:
+        depfile.write("%s: \\\n  %s\n" % (_Escape(output_file), " \\\n  ".join(map(_Escape, [f for f in files if os.path.exists(f)]))))
+
+def ApiHeaderFile(source_name, path):
+    return os.path.join(path, "json_" + source_name + ".h")
+
 def CreateApiHeader(log, source_name, path, headers):
     assert(headers)
 
-    header_file = os.path.join(path, "json_" + source_name + ".h")
+    header_file = ApiHeaderFile(source_name, path)
     with Emitter(header_file, config.INDENT_SIZE) as emitter:
         emitter.Line("// %s JSON-RPC API" % os.path.basename(source_name))
         emitter.Line("// Generated automatically. DO NOT EDIT.")
@@ -45,48 +61,155 @@ def CreateApiHeader(log, source_name, path, headers):
 
         log.Success("JSON-RPC API header generated in %s" % (os.path.basename(emitter.FileName())))
 
-def Create(log, schema, source_file, path, additional_includes, generate_classes, generate_stubs, generate_rpc):
-    def _ParseJsonRpcSchema(schema):
-        if "interface" in schema:
-            schema = schema["interface"]
+    return header_file
 
-        if "info" in schema:
-            if "class" in schema["info"]:
-                pluginClass = schema["info"]["class"]
-            else:
-                pluginClass = "undefined_class"
-                log.Error("no \"class\" defined in \"info\"")
+def _ParseJsonRpcSchema(log, schema):
+    if "interface" in schema:
+        schema = schema["interface"]
 
-            return JsonRpcSchema(pluginClass, schema)
+    if "info" in schema:
+        if "class" in schema["info"]:
+            pluginClass = schema["info"]["class"]
         else:
-            return None
+            pluginClass = "undefined_class"
+            log.Error("no \"class\" defined in \"info\"")
 
-    headers = []
+        return JsonRpcSchema(pluginClass, schema)
+    else:
+        return None
 
-    directory = path[0]
-    cpp_directory = path[1]
+def ScanObjects(log, schema):
+    # Only builds the classes of a schema, to find the ones it has in common with other schemas (see --shared-objects)
+    trackers.object_tracker.Reset()
+    return list(trackers.object_tracker.objects) if _ParseJsonRpcSchema(log, schema) else []
+
+def SharedHeaderFile(path):
+    return os.path.join(path, config.DATA_NAMESPACE + "_" + config.SHARED_OBJECTS + ".h")
+
+def CreateSharedHeader(log, objects, path):
+    # Takes (source file, object) pairs of all the source files of the run
+    header_file = SharedHeaderFile(path)
+    shared = trackers.CollectSharedObjects(objects)
+
+    if shared or config.KEEP_EMPTY:
+        with Emitter(header_file, config.INDENT_SIZE) as emitter:
+            class_emitter.EmitSharedObjects(log, shared, emitter)
+
+    if shared:
+        log.Success("Shared JSON data classes generated in %s" % os.path.basename(header_file))
+
+        return header_file
+    else:
+        log.Info("No JSON data classes in common")
+
+        if os.path.exists(header_file) and not config.KEEP_EMPTY:
+            os.remove(header_file)
 
+        return (header_file if config.KEEP_EMPTY else None)
+
+def _EnumRegistry(enum_file, source_file, read_only=False):
+    return (enum_registry.EnumRegistry(config.ENUM_REGISTRY, enum_file, source_file, read_only) if config.ENUM_REGISTRY else contextlib.nullcontext())
+
+def _FileName(schema, source_file):
     filename = (schema["info"]["namespace"]) if "info" in schema and "namespace" in schema["info"] else ""
     filename += (schema["info"]["class"]) if "info" in schema and "class" in schema["info"] else ""
 
     if len(filename) == 0:
         filename = os.path.basename(source_file.replace("Plugin", "").replace(".json", "").replace(".h", ""))
 
-    rpcObj = _ParseJsonRpcSchema(schema)
+    return filename
+
+def ListOutputs(schema, source_file, path, generate_classes, generate_stubs, generate_rpc, outputs):
+    # Same as Create(), but only tells the files it would write (see --list-outputs), given just an outline of the schema;
+    # nothing is emitted, so the files written only if there's code for them are listed, too (as with --keep-empty)
+    headers = []
+
+    directory = path[0]
+    cpp_directory = path[1]
+
+    filename = _FileName(schema, source_file)
+
+    face = schema.get("interface", schema)
+
+    if isinstance(face, dict) and ("info" in face):
+        files = []
+
+        if generate_classes:
+            files.append(os.path.join(directory, config.DATA_NAMESPACE + "_" + filename + ".h"))
+            headers.append(files[-1])
+
+            if config.OUT_OF_LINE_DATA:
+                files.append(os.path.join(cpp_directory, config.DATA_NAMESPACE + "_" + filename + ".cpp"))
+
+            if config.FORWARD_HEADERS:
+                files.append(os.path.join(directory, config.DATA_NAMESPACE + "_" + filename + "_fwd.h"))
+
+            files.append(os.path.join(cpp_directory, "JsonEnum_" + filename + ".cpp"))
+
+            if (face.get("mode") != "auto") and not config.NO_VERSIONING:
+                files.append(os.path.join(directory, "J" + filename + ".h"))
+                headers.append(files[-1])
+
+        if generate_stubs:
+            files.append(os.path.join(cpp_directory, filename + "JsonRpc.cpp"))
+
+        if generate_rpc and (face.get("mode") == "auto"):
+            files.append(os.path.join(directory, "J" + filename + ".h"))
+            headers.append(files[-1])
+
+        outputs.extend(files)
+
+    return headers
+
+def Create(log, schema, source_file, path, additional_includes, generate_classes, generate_stubs, generate_rpc, dependencies=None, outputs=None):
+    # All files read while loading the source (the source itself, $ref'd JSON files, C++ headers),
+    # the optional ones not found are not considered
+    inputs = dependencies if dependencies else [source_file]
+    newest_input = max([os.path.getmtime(f) for f in inputs if os.path.exists(f)], default=0)
+
+    def _IsUpToDate(output_file):
+        return (not config.FORCE and os.path.exists(output_file) and (newest_input < os.path.getmtime(output_file)))
+
+    def _Generated(output_file):
+        # Called for every output file, whether just generated or up-to-date
+        if os.path.exists(output_file) and (outputs != None):
+            outputs.append(output_file)
+
+    headers = []
+
+    directory = path[0]
+    cpp_directory = path[1]
+
+    filename = _FileName(schema, source_file)
+
+    rpcObj = _ParseJsonRpcSchema(log, schema)
     if rpcObj:
+        if config.SHARED_OBJECTS:
+            trackers.MarkSharedObjects(rpcObj)
+
         header_file = os.path.join(directory, config.DATA_NAMESPACE + "_" + filename + ".h")
+        impl_file = os.path.join(cpp_directory, config.DATA_NAMESPACE + "_" + filename + ".cpp")
+        forward_file = os.path.join(directory, config.DATA_NAMESPACE + "_" + filename + "_fwd.h")
         enum_file = os.path.join(cpp_directory, "JsonEnum_" + filename + ".cpp")
 
         data_emitted = 0
 
         if generate_classes:
             # Generate classes...
-            if not config.FORCE and (os.path.exists(header_file) and (os.path.getmtime(source_file) < os.path.getmtime(header_file))):
+            if _IsUpToDate(header_file) and (not config.OUT_OF_LINE_DATA or _IsUpToDate(impl_file)) \
+                    and (not config.FORWARD_HEADERS or _IsUpToDate(forward_file)):
                 log.Success("skipping file %s, up-to-date" % os.path.basename(header_file))
                 data_emitted = 1
             else:
-                with Emitter(header_file, config.INDENT_SIZE) as emitter:
-                    data_emitted = class_emitter.EmitObjects(log, rpcObj, emitter, os.path.basename(source_file), additional_includes, True)
+                impl_emitted = 0
+                forward_emitted = 0
+
+                with Emitter(header_file, config.INDENT_SIZE) as emitter, \
+                        (Emitter(impl_file, config.INDENT_SIZE) if config.OUT_OF_LINE_DATA else contextlib.nullcontext()) as impl, \
+                        (Emitter(forward_file, config.INDENT_SIZE) if config.FORWARD_HEADERS else contextlib.nullcontext()) as forward:
+                    data_emitted = class_emitter.EmitObjects(log, rpcObj, emitter, os.path.basename(source_file), additional_includes, True, impl, header_file, forward)
+                    impl_emitted = class_emitter.emittedDefinitions
+                    forward_emitted = class_emitter.emittedDeclarations
 
                     if data_emitted:
                         log.Success("JSON data classes generated in %s" % os.path.basename(emitter.FileName()))
@@ -94,38 +217,67 @@ def Create(log, schema, source_file, path, additional_includes, generate_classes
                     else:
                         log.Info("No JSON data classes generated for %s" % os.path.basename(filename))
 
+                # The implementation and forward files go along with the header, even if empty: the header is
+                # up-to-date only if these are, too
                 if not data_emitted and not config.KEEP_EMPTY:
-                    try:
-                        os.remove(header_file)
-                    except:
-                        pass
+                    for f in [header_file] + ([impl_file] if config.OUT_OF_LINE_DATA else []) + ([forward_file] if config.FORWARD_HEADERS else []):
+                        try:
+                            os.remove(f)
+                        except:
+                            pass
+
+                if config.OUT_OF_LINE_DATA and impl_emitted:
+                    log.Success("JSON data class implementation generated in %s" % os.path.basename(impl_file))
+
+                if config.FORWARD_HEADERS and forward_emitted:
+                    log.Success("JSON data class forward declarations generated in %s" % os.path.basename(forward_file))
+
+            _Generated(header_file)
+
+            if config.OUT_OF_LINE_DATA:
+                _Generated(impl_file)
+
+            if config.FORWARD_HEADERS:
+                _Generated(forward_file)
 
             # Generate enum registrations...
-            if not config.FORCE and (os.path.exists(enum_file) and (os.path.getmtime(source_file) < os.path.getmtime(enum_file))):
-                log.Success("skipping file %s, up-to-date" % os.path.basename(enum_file))
-                class_emitter.ProcessEnums(log)
-            else:
-                enum_emitted = 0
+            with _EnumRegistry(enum_file, source_file) as registry:
+                if _IsUpToDate(enum_file):
+                    log.Success("skipping file %s, up-to-date" % os.path.basename(enum_file))
+                    class_emitter.ProcessEnums(log, registry=registry)
+                else:
+                    enum_emitted = 0
 
-                with Emitter(enum_file, config.INDENT_SIZE) as emitter:
-                    enum_emitted = class_emitter.EmitEnumRegs(log, rpcObj, emitter, filename, os.path.basename(source_file))
+                    with Emitter(enum_file, config.INDENT_SIZE) as emitter:
+                        enum_emitted = class_emitter.EmitEnumRegs(log, rpcObj, emitter, filename, os.path.basename(source_file), registry)
 
-                    if enum_emitted:
-                        log.Success("JSON enumeration code generated in %s" % os.path.basename(emitter.FileName()))
-                    else:
-                        log.Info("No JSON enumeration code generated for %s" % os.path.basename(filename))
+                        if enum_emitted:
+                            log.Success("JSON enumeration code generated in %s" % os.path.basename(emitter.FileName()))
+                        else:
+                            log.Info("No JSON enumeration code generated for %s" % os.path.basename(filename))
+
+                    # A file leaving tables to other files is kept even if empty, it's made out of date
+                    # when it has to emit these (see --enum-registry)
+                    if not enum_emitted and not config.KEEP_EMPTY and not (registry and registry.deferred):
+                        try:
+                            os.remove(enum_file)
+                        except:
+                            pass
+
+                # Generated after the files it leaves tables to, so that it can take these over in the same build
+                if registry and (dependencies != None):
+                    if not dependencies:
+                        dependencies.append(source_file)
 
-                if not enum_emitted and not config.KEEP_EMPTY:
-                    try:
-                        os.remove(enum_file)
-                    except:
-                        pass
+                    dependencies.extend([f for f in registry.Dependencies() if f not in dependencies])
+
+            _Generated(enum_file)
 
             # Also emit version if source was json meta file in manual mode
             if (rpcObj.schema.get("mode") != "auto") and not config.NO_VERSIONING:
                 output_filename = os.path.join(directory, "J" + filename + ".h")
 
-                if not config.FORCE and (os.path.exists(output_filename) and (os.path.getmtime(source_file) < os.path.getmtime(output_filename))):
+                if _IsUpToDate(output_filename):
                     log.Success("skipping file %s, up-to-date" % os.path.basename(output_filename))
                 else:
                     with Emitter(output_filename, config.INDENT_SIZE) as emitter:
@@ -133,6 +285,8 @@ def Create(log, schema, source_file, path, additional_includes, generate_classes
                         log.Success("JSON-RPC version information generated in %s" % os.path.basename(emitter.FileName()))
                         headers.append(output_filename)
 
+                _Generated(output_filename)
+
 
         # Generate manual stub code...
         if generate_stubs:
@@ -140,11 +294,13 @@ def Create(log, schema, source_file, path, additional_includes, generate_classes
                 stub_emitter.EmitHelperCode(log, rpcObj, emitter, os.path.basename(header_file))
                 log.Success("JSON-RPC stubs generated in %s" % os.path.basename(emitter.FileName()))
 
+            _Generated(os.path.join(cpp_directory, filename + "JsonRpc.cpp"))
+
         # Generate full or semi automatic RPC code
         if generate_rpc and (rpcObj.schema.get("mode") == "auto"):
             output_filename = os.path.join(directory, "J" + filename + ".h")
 
-            if not config.FORCE and (os.path.exists(output_filename) and (os.path.getmtime(source_file) < os.path.getmtime(output_filename))):
+            if _IsUpToDate(output_filename):
                log.Success("skipping file %s, up-to-date" % os.path.basename(output_filename))
             else:
                 with Emitter(output_filename, config.INDENT_SIZE) as emitter:
@@ -152,6 +308,8 @@ def Create(log, schema, source_file, path, additional_includes, generate_classes
                     log.Success("JSON-RPC implementation generated in %s" % os.path.basename(emitter.FileName()))
                     headers.append(output_filename)
 
+            _Generated(output_filename)
+
     else:
         log.Info("No code to generate.")
 
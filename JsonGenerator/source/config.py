@@ -16,6 +16,7 @@
 # limitations under the License.
 
 import os
+import copy
 import posixpath
 import argparse
 from enum import Enum
@@ -48,13 +49,21 @@ GLOBAL_DEFINITIONS = ".." + os.sep + "global.json"
 INDENT_SIZE = 4
 ALWAYS_EMIT_COPY_CTOR = False
 KEEP_EMPTY = False
+OUT_OF_LINE_DATA = False
+FORWARD_HEADERS = False
+NO_API_HEADER = False
 CPP_INTERFACE_PATH = "interfaces" + os.sep
 JSON_INTERFACE_PATH = CPP_INTERFACE_PATH + "json"  + os.sep
 DUMP_JSON = False
 FORCE = False
+DEPFILE = False
 GENERATED_JSON = False
 LEGACY_ALT = False
 AUTO_PREFIX = False
+CONTIGUOUS_ITERATORS = False
+SERIALIZE_EVENTS_ONCE = False
+SHARED_OBJECTS = None
+ENUM_REGISTRY = None
 
 class RpcFormat(Enum):
     COMPLIANT = "compliant"
@@ -64,6 +73,9 @@ class RpcFormat(Enum):
 RPC_FORMAT = RpcFormat.COMPLIANT
 RPC_FORMAT_FORCED = False
 
+# The configuration may be parsed more than once in a process (see daemon.py), so each time start over from these
+_DEFAULTS = { name: value for name, value in globals().items() if name.isupper() }
+
 
 def Parse(cmdline):
     global FRAMEWORK_NAMESPACE
@@ -81,16 +93,26 @@ def Parse(cmdline):
     global INTERFACE_SOURCE_REVISION
     global INTERFACES_SECTION
     global FORCE
+    global DEPFILE
     global DUMP_JSON
     global RPC_FORMAT_FORCED
     global RPC_FORMAT
     global NO_DUP_WARNINGS
     global ALWAYS_EMIT_COPY_CTOR
     global KEEP_EMPTY
+    global OUT_OF_LINE_DATA
+    global FORWARD_HEADERS
+    global NO_API_HEADER
     global CLASSNAME_FROM_REF
     global LEGACY_ALT
+    global CONTIGUOUS_ITERATORS
+    global SERIALIZE_EVENTS_ONCE
+    global SHARED_OBJECTS
+    global ENUM_REGISTRY
     global AUTO_PREFIX
 
+    globals().update(copy.deepcopy(_DEFAULTS))
+
     argparser = argparse.ArgumentParser(
         description='Generate JSON C++ classes, stub code and API documentation from JSON definition files and C++ header files',
         epilog="For information about custom tags supprted in C++ code please see StubGenerator help (--help-tags).",
@@ -117,6 +139,12 @@ def Parse(cmdline):
             action="store_true",
             default=False,
             help="generate C++ stub code for JSON-RPC (i.e. J*.j header file to fill in manually)")
+    argparser.add_argument("-p",
+            "--proxystubs",
+            dest="proxystubs",
+            action="store_true",
+            default=False,
+            help="also generate COM-RPC proxy stubs (ProxyStubs_*.cpp) for C++ header files, parsing each header only once")
     argparser.add_argument("-o",
             "--output",
             dest="output_dir",
@@ -137,6 +165,49 @@ def Parse(cmdline):
             action="store_true",
             default=False,
             help= "force code generation even if destination appears up-to-date (default: force disabled)")
+    argparser.add_argument(
+            "--jobs",
+            dest="jobs",
+            metavar="N",
+            type=int,
+            action="store",
+            default=1,
+            help= "process up to N input files in parallel (default: 1)")
+    argparser.add_argument(
+            "--list-outputs",
+            dest="list_outputs",
+            action="store_true",
+            default=False,
+            help="only print the names of the files that would be generated, one per line, without generating them "
+                 "(files written only if there is code for them are listed, too; generate with --keep-empty to match)")
+    argparser.add_argument(
+            "--watch",
+            dest="watch",
+            action="store_true",
+            default=False,
+            help="keep running and regenerate the outputs whenever any of the input files (or the files they include) changes")
+    argparser.add_argument(
+            "--serve",
+            dest="serve",
+            metavar="SOCKET",
+            action="store",
+            default=None,
+            help="run as a daemon serving generator runs on a Unix socket; runs are handed over to it\n" \
+                 "if JSON_GENERATOR_SOCKET environment variable is set to the socket path (default: run once and exit)")
+    argparser.add_argument(
+            "--cache-dir",
+            dest="cache_dir",
+            metavar="DIR",
+            action="store",
+            default=None,
+            help="reuse the files generated from identical inputs and options, kept in a cache directory shared between build trees\n" \
+                 "(default: THUNDERTOOLS_CACHE_DIR environment variable if set, otherwise no cache)")
+    argparser.add_argument(
+            "--depfile",
+            dest="depfile",
+            action="store_true",
+            default=False,
+            help= "write a Make/Ninja style dependency file (<output>.d) next to each generated C++ file (default: no dependency files)")
     argparser.add_argument(
             "--no-warnings",
             dest="no_warnings",
@@ -239,6 +310,31 @@ def Parse(cmdline):
             action="store_true",
             default=False,
             help="do not use framework's alt support (default: use framework alt support)")
+    data_group.add_argument("--shared-objects",
+            dest="shared_objects",
+            metavar="NAME",
+            action="store",
+            default=None,
+            help="emit the classes that are identical in several of the source files once, into JsonData_NAME.h\n" \
+                 "(in the output directory of the first source file) and namespace JsonData::NAME (default: emit per source file)")
+    data_group.add_argument("--enum-registry",
+            dest="enum_registry",
+            metavar="FILE",
+            action="store",
+            default=None,
+            help="record in FILE, shared by all the runs of a build, which JsonEnum_*.cpp file emits the conversion table\n" \
+                 "of each C++ enum, so that every table is emitted only once (default: emit the tables per source file)")
+    data_group.add_argument("--serialize-events-once",
+            dest="serialize_events_once",
+            action="store_true",
+            default=False,
+            help="serialize event parameters to JSON text only once, also when notified under an alternative name (default: serialize per notification)")
+    data_group.add_argument("--contiguous-iterators",
+            dest="contiguous_iterators",
+            action="store_true",
+            default=False,
+            help="pass JSON arrays to @iterator parameters through a pre-reserved contiguous container,\n" \
+                 "instead of building an intermediate std::list (default: RPC::IteratorType with a list)")
     data_group.add_argument(
             "--no-push-warning",
             dest="no_push_warning",
@@ -250,6 +346,24 @@ def Parse(cmdline):
             action="store_true",
             default=False,
             help="always emit a copy constructor and assignment operator (default: emit only when needed)")
+    data_group.add_argument("--out-of-line-data",
+            dest="out_of_line_data",
+            action="store_true",
+            default=False,
+            help="only declare the member functions of JSON data classes in JsonData_*.h and define them in JsonData_*.cpp\n" \
+                 "(default: define all code inline in the header)")
+    data_group.add_argument("--forward-headers",
+            dest="forward_headers",
+            action="store_true",
+            default=False,
+            help="also emit JsonData_*_fwd.h headers with forward declarations of the JSON data classes and enums (default: no forward headers)")
+    data_group.add_argument(
+            "--no-api-header",
+            dest="no_api_header",
+            action="store_true",
+            default=False,
+            help="do not emit the json_*.h header including all the headers generated for a source file,\n" \
+                 "the JsonData_*.h and J*.h headers are to be included directly (default: emit the header)")
     data_group.add_argument("--def-int-size",
             dest="def_int_size",
             metavar="SIZE",
@@ -323,11 +437,19 @@ def Parse(cmdline):
     INDENT_SIZE = args.indent_size
     ALWAYS_EMIT_COPY_CTOR = args.copy_ctor
     KEEP_EMPTY = args.keep_empty
+    OUT_OF_LINE_DATA = args.out_of_line_data
+    FORWARD_HEADERS = args.forward_headers
+    NO_API_HEADER = args.no_api_header
     CLASSNAME_FROM_REF = not args.no_ref_names
     DEFAULT_INT_SIZE = args.def_int_size
     DUMP_JSON = args.dump_json
     FORCE = args.force
+    DEPFILE = args.depfile
     LEGACY_ALT = args.legacy_alt
+    CONTIGUOUS_ITERATORS = args.contiguous_iterators
+    SERIALIZE_EVENTS_ONCE = args.serialize_events_once
+    SHARED_OBJECTS = args.shared_objects
+    ENUM_REGISTRY = os.path.abspath(args.enum_registry) if args.enum_registry else None
     DEFAULT_DEFINITIONS_FILE = args.extra_include
     INTERFACES_SECTION = not args.no_interfaces_section
     INTERFACE_SOURCE_LOCATION = args.source_location
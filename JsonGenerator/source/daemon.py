@@ -0,0 +1,137 @@
+# If not stated otherwise in this file or this component's license file the
+# following copyright and licenses apply:
+#
+# Copyright 2020 Metrological
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Optional generator daemon: a long-lived process serving generator runs over a Unix socket,
+# so that the interpreter start-up, the imports, the parsed C++ trees and the loaded JSON documents are paid for only once.
+# NOTE: Keep this module light, the client side runs before any of the generator modules is imported.
+
+import os
+import sys
+import io
+import json
+import signal
+import socket
+import traceback
+import contextlib
+
+SOCKET_ENV = "JSON_GENERATOR_SOCKET"
+
+def _Send(conn, data):
+    payload = json.dumps(data).encode("utf-8")
+    conn.sendall(len(payload).to_bytes(4, "big") + payload)
+
+def _Receive(conn):
+    def _Read(size):
+        data = b""
+
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed")
+
+            data += chunk
+
+        return data
+
+    size = int.from_bytes(_Read(4), "big")
+    return json.loads(_Read(size).decode("utf-8"))
+
+def Forward(argv):
+    # Runs the generator in the daemon, if there is one; returns the exit status or None
+    path = os.environ.get(SOCKET_ENV)
+
+    if not path:
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(path)
+            _Send(conn, { "argv": argv, "cwd": os.getcwd(), "environ": dict(os.environ) })
+            response = _Receive(conn)
+    except (OSError, ValueError):
+        # No daemon (or it went away), the caller will run in-process instead
+        return None
+
+    sys.stdout.write(response["output"])
+    sys.stdout.flush()
+
+    return response["status"]
+
+def Serve(path, main, log):
+    # Serves the requests one by one, as the generator keeps its configuration in globals
+    if os.path.exists(path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+                conn.connect(path)
+
+            log.Error("a daemon is already listening on %s" % path)
+            return 1
+        except OSError:
+            # Stale socket
+            os.remove(path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(path)
+        server.listen()
+
+        log.Print("listening on %s" % path)
+
+        # Clean up the socket also when terminated
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        try:
+            while True:
+                conn, _ = server.accept()
+
+                with conn:
+                    try:
+                        request = _Receive(conn)
+                    except (OSError, ValueError):
+                        continue
+
+                    output = io.StringIO()
+                    cwd = os.getcwd()
+                    environ = dict(os.environ)
+
+                    try:
+                        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                            try:
+                                os.environ.clear()
+                                os.environ.update(request["environ"])
+                                os.chdir(request["cwd"])
+                                status = main(request["argv"])
+                            except SystemExit as exc:
+                                status = exc.code if isinstance(exc.code, int) else (0 if exc.code == None else 1)
+                            except Exception:
+                                traceback.print_exc()
+                                status = 1
+                    finally:
+                        os.chdir(cwd)
+                        os.environ.clear()
+                        os.environ.update(environ)
+
+                    try:
+                        _Send(conn, { "output": output.getvalue(), "status": status })
+                    except OSError:
+                        pass
+
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            os.remove(path)
+
+    return 0
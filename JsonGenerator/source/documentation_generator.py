@@ -27,9 +27,12 @@ from emitter import Emitter
 class DocumentationError(RuntimeError):
     pass
 
+def OutputFile(path):
+    return os.path.dirname(path) + os.sep + os.path.basename(path).replace(".json", "") + ".md"
+
 def Create(log, schema, path, indent_size = 4):
     input_basename = os.path.basename(path)
-    output_path = os.path.dirname(path) + os.sep + input_basename.replace(".json", "") + ".md"
+    output_path = OutputFile(path)
 
     with Emitter(output_path, config.INDENT_SIZE, 10000) as emit:
         def bold(string):
@@ -988,3 +991,5 @@ def Create(log, schema, path, indent_size = 4):
                         event=True)
 
         log.Success("Document created: %s" % output_path)
+
+    return output_path
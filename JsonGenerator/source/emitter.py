@@ -15,13 +15,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+# Lines are written out in chunks as soon as nothing before them is still to be filled in (see Slot)
+STREAM_CHUNK = 256 # lines
+
 class Emitter():
     def __init__(self, file_name, indent_size, max_line_length = 160):
         self.file = open(file_name, "w") if file_name else None
         self.indent_size = indent_size
         self.indent = 0
         self.threshold = max_line_length
-        self.lines = []
+        self.closed = False
+        self.__lines = []
+        self.__chunks = [self.__lines] # lists of lines and slots (emitters), in the output order
+        self.__last = None
 
     def __del__(self):
         pass
@@ -30,29 +36,61 @@ class Emitter():
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        self.closed = True
+
         if self.file:
             self.Flush()
             self.file.close()
 
+    def __Wrap(self, text):
+        # Breaks the line after a comma each time it exceeds another multiple of the threshold,
+        # the continuation lines are indented twice
+        separator = "\n" + " " * (self.indent + self.indent_size * 2) + ("// " if "//" in text else "")
+        pieces = []
+        length = 0 # of the pieces so far
+        pos = 0
+        iteration = 1
+
+        while (length + len(text) - pos) > (self.threshold * iteration):
+            limit = self.threshold * iteration
+            index = text.rfind(",", pos, pos + max(0, limit - length))
+
+            if (index != -1) and (length + index - pos) > 0:
+                pieces.append(text[pos:index + 1])
+                pieces.append(separator)
+                length += (index + 1 - pos) + len(separator)
+                pos = index + 1
+            elif pieces:
+                # No comma in the remaining text within the limit, so break again after the previous one
+                pieces.append(separator)
+                length += len(separator)
+            else:
+                break
+
+            iteration += 1
+
+        if pieces:
+            pieces.append(text[pos:])
+            return "".join(pieces)
+        else:
+            return text
+
     def Line(self, text = ""):
         if text != "":
-            commented = "// " if "//" in text else ""
             text = (" " * self.indent) + str(text)
-            iteration = 1
 
-            while len(text) > (self.threshold * iteration):
-                index = text.rfind(",", 0, self.threshold * iteration)
-                if index > 0:
-                    text = text[0:index+1] + "\n" + " " * (self.indent + self.indent_size * 2) + commented + text[index + 1 + (1 if text[index] == ', ' else 0):]
-                    iteration += 1
-                else:
-                    break
+            if len(text) > self.threshold:
+                text = self.__Wrap(text)
 
-            self.lines.append(text)
+            self.__lines.append(text)
+            self.__last = text
 
-        elif len(self.lines) and self.lines[-1] != "":
-            self.lines.append("")
+            if self.file and (len(self.__lines) >= STREAM_CHUNK):
+                self.__Stream()
 
+        elif self.__last != None and self.__last != "":
+            self.__lines.append("")
+            self.__last = ""
 
     def Indent(self):
         self.indent += self.indent_size
@@ -63,16 +101,65 @@ class Emitter():
         else:
             self.indent = 0
 
+    def Slot(self):
+        # Reserves a place for lines to be emitted later on (e.g. a prologue depending on what follows);
+        # the slot is complete once exited as a context manager
+        slot = Emitter(None, self.indent_size, self.threshold)
+        slot.indent = self.indent
+        self.__chunks.append(slot)
+        self.__lines = []
+        self.__chunks.append(self.__lines)
+        return slot
+
     def Prepend(self, other):
-        self.lines = other.lines + self.lines
+        if self.file and (self.file.tell() > 0):
+            raise RuntimeError("can't prepend to %s, part of it is already written (use a slot)" % self.FileName())
+
+        self.__chunks.insert(0, other)
+        other.closed = True
+
+        if self.__last == None:
+            self.__last = other.__last
 
     def Append(self, other):
-        self.lines.extend(other.lines)
+        self.__chunks.append(other)
+        other.closed = True
+        self.__lines = []
+        self.__chunks.append(self.__lines)
+
+        if other.__last != None:
+            self.__last = other.__last
 
     def FileName(self):
         return self.file.name if self.file else None
 
+    def __Write(self, file, until_open_slot):
+        # Writes out the chunks (nested slots included) and drops them; returns False if stopped at an open slot
+        while self.__chunks:
+            chunk = self.__chunks[0]
+
+            if isinstance(chunk, Emitter):
+                if until_open_slot and not chunk.closed:
+                    return False
+
+                if not chunk.__Write(file, until_open_slot):
+                    return False
+            elif chunk:
+                file.write("\n".join(chunk))
+                file.write("\n")
+
+            if chunk is self.__lines:
+                # Keep the current chunk in place, only empty it
+                del chunk[:]
+                return True
+
+            self.__chunks.pop(0)
+
+        return True
+
+    def __Stream(self):
+        self.__Write(self.file, True)
+
     def Flush(self):
         if self.file:
-            for line in self.lines:
-                self.file.write(line + "\n")
+            self.__Write(self.file, False)
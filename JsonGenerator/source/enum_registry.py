@@ -0,0 +1,158 @@
+# If not stated otherwise in this file or this component's license file the
+# following copyright and licenses apply:
+#
+# Copyright 2020 Metrological
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Build-wide record of the file each enum conversion table is emitted into (see --enum-registry),
+# so that an enum used by several interfaces gets its table emitted only once.
+# The registry is shared by all the generator runs (and jobs) of a build, so it's locked while in use.
+# The files leaving a table to another file are recorded, too. These depend on that file (see Dependencies()),
+# so that the build generates them after it; when it does not emit the table anymore (or is gone), they're made
+# out of date, to be generated again, emitting the table then. A run processes such files again itself, too (see Outdated()).
+
+import os
+import json
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # no locking available, runs must not be concurrent then
+
+
+class EnumRegistry:
+    def __init__(self, path, owner=None, source_file=None, read_only=False):
+        self.path = path
+        self.owner = os.path.abspath(owner) if owner else None
+        self.source_file = os.path.abspath(source_file) if source_file else None
+        self.read_only = read_only
+        self.tables = dict() # enum name to the owner and the deferring files (with their source files)
+        self.outdated = dict() # files made out of date, with their source files
+        self.claimed = set()
+        self.deferred = set()
+        self.dependencies = []
+        self.lock = None
+
+    def __enter__(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self.lock = open(self.path + ".lock", "w")
+
+        if fcntl:
+            fcntl.flock(self.lock, fcntl.LOCK_SH if self.read_only else fcntl.LOCK_EX)
+
+        try:
+            with open(self.path, "r") as file:
+                content = json.load(file)
+
+            self.tables = dict([(n, e) for n, e in content["tables"].items() if isinstance(e, dict)])
+            self.outdated = content["outdated"]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.tables = dict()
+            self.outdated = dict()
+
+        if not self.read_only:
+            self.outdated.pop(self.owner, None)
+
+            # The tables of the files that are gone are up for grabs again, before anything is checked for being up-to-date
+            for name in [n for n, e in self.tables.items() if (e["owner"] != self.owner) and not os.path.exists(e["owner"])]:
+                self.__Outdate(self.tables.pop(name)["deferring"])
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if not self.read_only and (exc_type == None):
+                # The enums not emitted by the owner anymore are up for grabs again
+                for name in [n for n, e in self.tables.items() if (e["owner"] == self.owner) and (n not in self.claimed)]:
+                    self.__Outdate(self.tables.pop(name)["deferring"])
+
+                for name, entry in self.tables.items():
+                    if (self.owner in entry["deferring"]) and (name not in self.deferred):
+                        del entry["deferring"][self.owner]
+
+                self.outdated = dict([(f, s) for f, s in self.outdated.items() if os.path.exists(f)])
+
+                # Write to a temporary file and move it in place, so that a failed run never leaves a partial registry
+                with tempfile.NamedTemporaryFile(mode="w", dir=(os.path.dirname(self.path) or "."), delete=False) as file:
+                    json.dump({ "tables": self.tables, "outdated": self.outdated }, file, indent=1, sort_keys=True)
+
+                os.replace(file.name, self.path)
+        finally:
+            if fcntl:
+                fcntl.flock(self.lock, fcntl.LOCK_UN)
+
+            self.lock.close()
+
+    def __Outdate(self, files):
+        # Older than any source file, so that both the build and the generator see these as out of date
+        for f, source_file in files.items():
+            if os.path.exists(f):
+                os.utime(f, (0, 0))
+                self.outdated[f] = source_file
+
+    def __DependsOn(self, owner, target):
+        # Tells if the owner depends (maybe through other files) on the target
+        visited = set()
+        pending = [owner]
+
+        while pending:
+            f = pending.pop()
+
+            if f == target:
+                return True
+
+            if f not in visited:
+                visited.add(f)
+                pending.extend([e["owner"] for e in self.tables.values() if f in e["deferring"]])
+
+        return False
+
+    def Claim(self, name):
+        # Tells if the owner is to emit the conversion table of the enum;
+        # the table stays with the file that first emitted it, for as long as the file exists
+        entry = self.tables.get(name)
+
+        if entry and (entry["owner"] != self.owner) and os.path.exists(entry["owner"]):
+            entry["deferring"][self.owner] = self.source_file
+            self.deferred.add(name)
+
+            # The build can't order files depending on each other, these have to do with being made out of date
+            if (entry["owner"] not in self.dependencies) and not self.__DependsOn(entry["owner"], self.owner):
+                self.dependencies.append(entry["owner"])
+
+            return False
+
+        deferring = (entry["deferring"] if entry else dict())
+        deferring.pop(self.owner, None)
+
+        self.tables[name] = { "owner": self.owner, "deferring": deferring }
+        self.claimed.add(name)
+        return True
+
+    def Owner(self, name):
+        entry = self.tables.get(name)
+        return (entry["owner"] if entry else None)
+
+    def Dependencies(self):
+        # The files the owner leaves tables to, for the build to generate it after these
+        return self.dependencies
+
+
+def Outdated(path):
+    # The source files of the files made out of date since these were last generated
+    with EnumRegistry(path, read_only=True) as registry:
+        return set([s for s in registry.outdated.values() if s])
@@ -17,8 +17,10 @@
 
 import sys
 import os
+import io
 import json
 import copy
+import contextlib
 import posixpath
 from collections import OrderedDict
 
@@ -28,6 +30,7 @@ sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pard
 
 import ProxyStubGenerator.CppParser as CppParser
 import ProxyStubGenerator.Interface as CppInterface
+import ProxyStubGenerator.Scanner as Scanner
 
 
 class CppParseError(RuntimeError):
@@ -42,15 +45,25 @@ class CppParseError(RuntimeError):
             super(CppParseError, self).__init__(msg)
 
 
-def LoadInterfaceInternal(file, tree, ns, log, all = False, include_paths = []):
+def StripFrameworkNamespace(identifier):
+    return str(identifier).replace("::" + config.FRAMEWORK_NAMESPACE + "::", "")
 
-    def StripFrameworkNamespace(identifier):
-        return str(identifier).replace("::" + config.FRAMEWORK_NAMESPACE + "::", "")
+def LoadInterfaceInternal(file, tree, ns, log, interfaces, include_paths = []):
 
     def StripInterfaceNamespace(identifier):
         return str(identifier).replace(ns + "::", "")
 
-    interfaces = [i for i in CppInterface.FindInterfaceClasses(tree, ns, file, []) if (i.obj.is_json or (all and not i.obj.is_event))]
+    # Structs are typically passed around in many methods, so they are converted only once
+    converted_objects = dict()
+
+    def Copy(data):
+        # Plain (i.e. JSON-like) data copy, much cheaper than copy.deepcopy()
+        if isinstance(data, dict):
+            return { k: Copy(v) for k, v in data.items() }
+        elif isinstance(data, list):
+            return [Copy(v) for v in data]
+        else:
+            return data
 
     def Build(face):
         def _EvaluateRpcFormat(obj):
@@ -313,6 +326,36 @@ def LoadInterfaceInternal(file, tree, ns, log, all = False, include_paths = []):
                 # POD objects
                 elif isinstance(cppType, CppParser.Class):
                     def GenerateObject(ctype, was_typdef):
+                        # The conversion depends on the meta data of the members, too
+                        members = tuple([(p.name, tuple(sorted([(k, repr(v)) for k, v in vars(p.meta).items()]))) for p in ctype.Merge().vars])
+                        key = (ctype.full_name, members, was_typdef, _case_format, rpc_format, quiet)
+
+                        if key not in converted_objects:
+                            # Keep what was reported about the members, in order
+                            warnings_before = len(log.warnings)
+                            infos_before = len(log.infos)
+
+                            output = io.StringIO()
+
+                            try:
+                                with contextlib.redirect_stdout(output):
+                                    result = _GenerateObject(ctype, was_typdef)
+                            finally:
+                                sys.stdout.write(output.getvalue())
+
+                            converted_objects[key] = (result, log.warnings[warnings_before:], log.infos[infos_before:], output.getvalue())
+                        else:
+                            # Report the issues with the members again, as if converted anew
+                            result, warnings, infos, output = converted_objects[key]
+                            log.warnings.extend(warnings)
+                            log.infos.extend(infos)
+                            sys.stdout.write(output)
+
+                        # The callers are free to modify the result, hand out a copy
+                        kind, props = result
+                        return kind, Copy(props)
+
+                    def _GenerateObject(ctype, was_typdef):
                         properties = dict()
 
                         kind = ctype.Merge()
@@ -995,40 +1038,58 @@ def LoadInterfaceInternal(file, tree, ns, log, all = False, include_paths = []):
 
     schemas = []
 
-    if interfaces:
-        for face in interfaces:
-            schema = Build(face)
-            if schema:
-                schemas.append(schema)
+    for face in interfaces:
+        schema = Build(face)
+        if schema:
+            schemas.append(schema)
 
-        for s in schemas:
-            lookups = s["@lookups"] if "@lookups" in s else []
-            for l in lookups:
-                for s2 in schemas:
-                    if StripFrameworkNamespace(s2["@fullname"]) == l:
-                        del s2["@generated"]
+    return schemas, []
 
-        schemas = [s for s in schemas if "@generated" in s]
+def ParseHeader(file, log, include_paths = [], dependencies = None, extra_includes = []):
+    try:
+        return CppParser.ParseFiles([os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                    posixpath.normpath(config.DEFAULT_DEFINITIONS_FILE))] + extra_includes + [file],
+                    config.FRAMEWORK_NAMESPACE, include_paths, log, dependencies)
 
-    return schemas, []
+    except CppParser.ParserError as ex:
+        raise CppParseError(None, str(ex))
+    except CppParser.LoaderError as ex:
+        raise CppParseError(None, str(ex))
 
-def LoadInterface(file, log, all = False, include_paths = []):
+def LoadInterface(file, log, all = False, include_paths = [], dependencies = None, tree = None):
+    # An already parsed tree of the file may be provided
     try:
         schemas = []
         includes = []
 
-        tree = CppParser.ParseFiles([os.path.join(os.path.dirname(os.path.realpath(__file__)),
-                   posixpath.normpath(config.DEFAULT_DEFINITIONS_FILE)), file], config.FRAMEWORK_NAMESPACE, include_paths, log)
+        if not tree:
+            tree = ParseHeader(file, log, include_paths, dependencies)
+
+        # Find all the interfaces in one go and assign each to the first namespace it belongs to
+        # (namespaces may be nested, e.g. Exchange::JSONRPC within Exchange)
+        interfaces = OrderedDict([(ns, []) for ns in config.INTERFACE_NAMESPACES])
 
-        for ns in config.INTERFACE_NAMESPACES:
-            their_schemas, their_includes = LoadInterfaceInternal(file, tree, ns, log, all, include_paths)
+        for face in CppInterface.FindInterfaceClasses(tree, "", file, []):
+            if face.obj.is_json or (all and not face.obj.is_event):
+                ns = next((ns for ns in interfaces if (ns + "::") in face.obj.full_name), None)
+                if ns:
+                    interfaces[ns].append(face)
 
-            for s in their_schemas:
-                f = list(filter(lambda x: x["@fullname"] == s["@fullname"], schemas))
-                if not f:
-                    schemas.append(s)
+        for ns, faces in interfaces.items():
+            if faces:
+                their_schemas, their_includes = LoadInterfaceInternal(file, tree, ns, log, faces, include_paths)
+                schemas.extend(their_schemas)
+                includes.extend(their_includes)
 
-            includes.extend(their_includes)
+        # Interfaces acquired via @lookup methods are not generated on their own
+        schemas_by_name = dict([(StripFrameworkNamespace(s["@fullname"]), s) for s in schemas])
+
+        for s in schemas:
+            for l in s.get("@lookups", []):
+                if l in schemas_by_name:
+                    schemas_by_name[l].pop("@generated", None)
+
+        schemas = [s for s in schemas if "@generated" in s]
 
         if not schemas:
             log.Info("No interfaces found")
@@ -1046,3 +1107,34 @@ def LoadInterface(file, log, all = False, include_paths = []):
         raise CppParseError(None, str(ex))
     except CppParser.LoaderError as ex:
         raise CppParseError(None, str(ex))
+
+def ScanInterface(file):
+    # Outlines of the schemas LoadInterface() would build, with only the names in them (see --list-outputs);
+    # the file is just scanned for the tagged classes, not parsed
+    classes = [c for c in Scanner.Scan(file, config.FRAMEWORK_NAMESPACE) if c.is_json and not c.is_template]
+    lookups = sum([c.lookups for c in classes], [])
+
+    interfaces = OrderedDict([(ns, []) for ns in config.INTERFACE_NAMESPACES])
+
+    for c in classes:
+        ns = next((ns for ns in interfaces if (ns + "::") in c.full_name), None)
+
+        # Interfaces acquired via @lookup methods are not generated on their own
+        if ns and (c.name not in lookups):
+            interfaces[ns].append(c)
+
+    schemas = []
+
+    for ns, faces in interfaces.items():
+        for c in faces:
+            info = dict()
+
+            if not c.parent_full_name.endswith(ns):
+                info["namespace"] = c.parent_name[1:] if (c.parent_name[0] == "I" and c.parent_name[1].isupper()) else c.parent_name
+
+            info["class"] = c.name[1:] if c.name[0] == "I" else c.name
+            info["title"] = info["class"] + " API"
+
+            schemas.append(OrderedDict([("$schema", "interface.json.schema"), ("mode", "auto"), ("info", info)]))
+
+    return schemas
@@ -35,6 +35,9 @@ import header_loader
 import trackers
 
 
+# Loaded JSON documents kept between runs (see --serve), None if not to be kept
+document_cache = None
+
 log = None
 def SetLogger(logger):
     global log
@@ -46,7 +49,13 @@ def Tstring(string):
 def Scoped(root, obj, full = True):
     scope = ""
 
-    if isinstance(obj, (JsonObject, JsonEnum, JsonArray)):
+    if isinstance(obj, JsonObject) and (obj.ref_destination if obj.is_duplicate else obj).shared_class:
+        scope = "%s::" % config.SHARED_OBJECTS
+
+        if full:
+            scope = "%s::" % (config.DATA_NAMESPACE) + scope
+
+    elif isinstance(obj, (JsonObject, JsonEnum, JsonArray)):
         o = obj
 
         # Go down the class hierarchy...
@@ -68,6 +77,25 @@ def Scoped(root, obj, full = True):
     return scope
 
 
+def Memoized(method):
+    # Read-only property computed once per instance; the stored values are dropped with InvalidateCache()
+    key = method.__qualname__ # distinct keys, so that super() still reaches the base implementation
+
+    def _Get(self):
+        cache = self.__dict__.get("_cache")
+
+        if cache == None:
+            cache = self.__dict__["_cache"] = dict()
+        elif key in cache:
+            return cache[key]
+
+        value = method(self)
+        cache[key] = value
+        return value
+
+    return property(_Get)
+
+
 class JsonParseError(RuntimeError):
     pass
 
@@ -158,7 +186,7 @@ class JsonType():
                 log.DocIssue("'%s': sentence-case capitalization is recommended for parameter descriptions ('%s')"
                     % (self.print_name ,log.Ellipsis(self.description)))
 
-    @property
+    @Memoized
     def temp_name(self):
         name = self.local_name.lstrip('_')
         return ("_" + name[0].lower() + name[1:] + "_")
@@ -172,6 +200,14 @@ class JsonType():
     def Rename(self, new_name):
         self.new_name = new_name.lower()
         self.is_renamed = True
+        self.InvalidateCache()
+
+    def InvalidateCache(self):
+        # Names and types of the members are derived from the names of their parents
+        self.__dict__.pop("_cache", None)
+
+        for prop in self.properties:
+            prop.InvalidateCache()
 
     @property
     def objects(self):
@@ -181,18 +217,18 @@ class JsonType():
     def properties(self):
         return []
 
-    @property
+    @Memoized
     def print_name(self):
         return (self.parent.print_name + "/" + self.name)
 
-    @property
+    @Memoized
     def json_name(self):
         if self.new_name:
             return self.new_name
         else:
             return self.name
 
-    @property
+    @Memoized
     def local_name(self):
         if self.new_name:
             name = self.new_name
@@ -206,7 +242,7 @@ class JsonType():
 
         return name
 
-    @property
+    @Memoized
     def actual_name(self):
         if self.new_name:
             return self.new_name
@@ -223,7 +259,7 @@ class JsonType():
     def convert(self):
         return ""
 
-    @property
+    @Memoized
     def cpp_name(self): # C++ name of the object
         if self.new_name:
             return (self.new_name[0].upper() + self.new_name[1:])
@@ -232,11 +268,11 @@ class JsonType():
         else:
             return (self.name[0].upper() + self.name[1:])
 
-    @property
+    @Memoized
     def cpp_type(self): # C++ type of the object (e.g. may be array)
         return (Scoped(self.root, self) + self.cpp_class)
 
-    @property
+    @Memoized
     def short_cpp_type(self):
         return self.cpp_type.replace("%s::%s::" % (config.DATA_NAMESPACE, self.root.cpp_class), "")
 
@@ -248,7 +284,7 @@ class JsonType():
     def cpp_native_type(self):
         assert False, "cpp_native_type accessed on JsonType"
 
-    @property
+    @Memoized
     def cpp_native_type_opt(self):
         if self.optional:
             return ("Core::OptionalType<%s>" % self.cpp_native_type)
@@ -269,7 +305,7 @@ class JsonType():
     def default_value(self): # Value to initialize with in C++
         return self.schema.get("@default")
 
-    @property
+    @Memoized
     def root(self):
         return self.parent.root
 
@@ -381,11 +417,16 @@ class JsonInstanceId(JsonNative, JsonType):
 class JsonRefCounted():
     def __init__(self):
         self.ref_destination = None
-        self.refs = []
-        self.AddRef(self)
+        self.refs = [self]
 
     def AddRef(self, obj):
         self.refs.append(obj)
+        self.InvalidateRefs()
+
+    def InvalidateRefs(self):
+        # Class names of the object and of all its duplicates depend on the reference count
+        for ref in self.refs:
+            ref.InvalidateCache()
 
     def RefCount(self):
         return len(self.refs)
@@ -523,15 +564,15 @@ class JsonEnum(JsonRefCounted, JsonType):
 
         return classname
 
-    @property
+    @Memoized
     def cpp_type(self):
         return CoreJson("EnumType<%s>" % (self.cpp_native_type))
 
-    @property
+    @Memoized
     def cpp_native_type(self):
         return self.original_type if self.original_type else (Scoped(self.root, self) + self.cpp_class)
 
-    @property
+    @Memoized
     def cpp_class(self):
         if self.is_duplicate:
             # Use the original (ie. first seen) name
@@ -548,6 +589,7 @@ class JsonObject(JsonRefCounted, JsonType):
         self._properties = []
         self._objects = []
         self._enums = []
+        self.shared_class = None # set if emitted in the shared header instead (see --shared-objects)
 
         # Handle duplicate objects...
         if "properties" in schema:
@@ -566,6 +608,10 @@ class JsonObject(JsonRefCounted, JsonType):
                     trackers.object_tracker.Add(obj)
                     if obj.parent != self.parent and not trackers.IsInCustomRef(obj):
                         self.AddRef(obj)
+                    else:
+                        self.InvalidateRefs()
+
+                    obj.InvalidateCache()
                 else:
                     self.is_duplicate = True
                     self.ref_destination = obj
@@ -609,7 +655,7 @@ class JsonObject(JsonRefCounted, JsonType):
         if not self.properties:
             log.Error("No properties in object %s" % self.print_name)
 
-    @property
+    @Memoized
     def cpp_name(self):
         # NOTE: Special cases for names for Methods and Arrays
         if self.is_renamed:
@@ -621,11 +667,13 @@ class JsonObject(JsonRefCounted, JsonType):
         else:
             return super().cpp_name
 
-    @property
+    @Memoized
     def cpp_class(self):
         if self.is_duplicate:
             # Use the original (ie. first seen) class name
             return self.ref_destination.cpp_class
+        elif self.shared_class:
+            return self.shared_class
         else:
             classname = ""
             if "class" in self.schema:
@@ -661,15 +709,15 @@ class JsonObject(JsonRefCounted, JsonType):
 
             return classname
 
-    @property
+    @Memoized
     def json_name(self):
         return self.name.strip("#")
 
-    @property
+    @Memoized
     def cpp_type(self):
         return Scoped(self.root, self) + self.cpp_class
 
-    @property
+    @Memoized
     def cpp_native_type(self):
         return self.original_type if self.original_type else self.cpp_type
 
@@ -716,7 +764,13 @@ class JsonArray(JsonType):
     def RefCount(self):
         return self.items.RefCount()
 
-    @property
+    def InvalidateCache(self):
+        self.__dict__.pop("_cache", None)
+
+        if self._items:
+            self._items.InvalidateCache()
+
+    @Memoized
     def cpp_name(self):
         if self.is_renamed:
             return super().cpp_name
@@ -967,7 +1021,7 @@ class JsonRpcSchema(JsonType):
     def print_name(self):
         return ""
 
-    @property
+    @Memoized
     def cpp_class(self):
         return ((self.namespace + "::") if self.namespace else "") + super().cpp_name
 
@@ -983,6 +1037,50 @@ class JsonRpcSchema(JsonType):
         return 1
 
 
+def _HasNestedOverrides(schema, visited=None):
+    # Tells if there's a reference with overriden properties anywhere below the schema
+    if visited == None:
+        visited = set()
+
+    if id(schema) in visited:
+        return False
+
+    visited.add(id(schema))
+
+    if isinstance(schema, dict):
+        items = schema.values()
+    elif isinstance(schema, list):
+        items = schema
+    else:
+        return False
+
+    for item in items:
+        if isinstance(item, jsonref.JsonRef) and isinstance(item, dict):
+            if any(key in item.__reference__ for key in ["description", "summary", "example", "default"]):
+                return True
+
+        if _HasNestedOverrides(item, visited):
+            return True
+
+    return False
+
+
+def SchemaOverlay(schema, overrides=None):
+    # Copy-on-write view of a schema: only the top level is duplicated (so keys can be overriden
+    # without affecting the original), all nested elements are shared with the original schema.
+    # A full copy is still made if nested references override properties, as these overrides
+    # have never been applied to copied schemas (and sharing would apply them).
+    if _HasNestedOverrides(schema):
+        overlay = copy.deepcopy(schema)
+    else:
+        overlay = OrderedDict(schema)
+
+    if overrides:
+        overlay.update(overrides)
+
+    return overlay
+
+
 def JsonItem(name, parent, schema, included=None):
     # Create the appropriate Python object based on the JSON type
     if "type" in schema:
@@ -1019,7 +1117,7 @@ def JsonItem(name, parent, schema, included=None):
         raise JsonParseError("missing 'type' for item: '%s'" % name)
 
 
-def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths):
+def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths, dependencies=None):
     additional_includes = []
 
     def Adjust(schema):
@@ -1046,8 +1144,8 @@ def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths):
                                     prop["result"] = prop["params"]
                                     del prop["params"]
                                 else:
-                                    prop["result"] = copy.deepcopy(prop["params"]["properties"]["value"]) if compliance_adjusted else copy.deepcopy(prop["params"])
-                                    prop["result"]["@ref"] = "#../params"
+                                    prop["result"] = SchemaOverlay(prop["params"]["properties"]["value"] if compliance_adjusted else prop["params"],
+                                                                   { "@ref": "#../params" })
 
             rpc_format = config.RPC_FORMAT
 
@@ -1079,43 +1177,50 @@ def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths):
 
             return data
 
-        def _FindCpp(element, schema):
+        def _IndexCpp(schema, index):
+            # Maps every @originaltype to its first occurence (depth-first, like a linear search would find it)
             if isinstance(schema, dict):
                 if "@originaltype" in schema:
-                    if schema["@originaltype"] == element:
-                        return schema
+                    index.setdefault(schema["@originaltype"], schema)
 
                 for _, item in schema.items():
-                    found = _FindCpp(element, item)
-                    if found:
-                        return found
+                    _IndexCpp(item, index)
+
+            return index
+
+        def _FindCpp(element, schema):
+            if not isinstance(schema, dict):
+                return None
+
+            # Index each C++-derived document only once, it's going to be searched for every @dataref
+            index = cpp_indexes.get(id(schema))
+
+            if index == None:
+                index = _IndexCpp(schema, dict())
+                cpp_indexes[id(schema)] = index
+
+            return index.get(element)
 
-            return None
+        def _Overrides(ref, source):
+            # Only these properties may be overriden next to a reference
+            overrides = OrderedDict([("@ref", ref)])
+
+            for key in ["description", "summary", "example", "default"]:
+                if key in source:
+                    overrides[key] = source[key]
+
+            return overrides
 
         # Tags all objects that used to be $references
         if isinstance(schema, jsonref.JsonRef) and isinstance(schema, dict):
             if "description" in schema.__reference__ or "example" in schema.__reference__ or "default" in schema.__reference__ or "summary" in schema.__reference__:
                 # Need a copy, there an override on one of the properites
+                new_schema = SchemaOverlay(schema, _Overrides(schema.__reference__["$ref"], schema.__reference__))
+
                 if idx == None:
-                    parent[parent_name] = copy.deepcopy(schema)
-                    new_schema = parent[parent_name]
+                    parent[parent_name] = new_schema
                 else:
-                    parent[parent_name][idx] = copy.deepcopy(schema)
-                    new_schema = parent[parent_name][idx]
-
-                new_schema["@ref"] = schema.__reference__["$ref"]
-
-                if "description" in schema.__reference__:
-                    new_schema["description"] = schema.__reference__["description"]
-
-                if "summary" in schema.__reference__:
-                    new_schema["summary"] = schema.__reference__["summary"]
-
-                if "example" in schema.__reference__:
-                    new_schema["example"] = schema.__reference__["example"]
-
-                if "default" in schema.__reference__:
-                    new_schema["default"] = schema.__reference__["default"]
+                    parent[parent_name][idx] = new_schema
 
                 schema = new_schema
             else:
@@ -1150,20 +1255,7 @@ def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths):
                         cpp_obj = _FindCpp(cpp_path, o)
 
                         if cpp_obj:
-                            parent[parent_name] = copy.deepcopy(cpp_obj)
-                            parent[parent_name]["@ref"] = "@" + json_path + "/" + cpp_obj["@originalname"]
-
-                            if "description" in schema:
-                                parent[parent_name]["description"] = schema["description"]
-
-                            if "summary" in schema:
-                                parent[parent_name]["summary"] = schema["summary"]
-
-                            if "example" in schema:
-                                parent[parent_name]["example"] = schema["example"]
-
-                            if "default" in schema:
-                                parent[parent_name]["default"] = schema["default"]
+                            parent[parent_name] = SchemaOverlay(cpp_obj, _Overrides("@" + json_path + "/" + cpp_obj["@originalname"], schema))
 
                             found = True
                             break
@@ -1174,8 +1266,17 @@ def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths):
                     raise IOError("Failed to find $ref path '%s' (JSON part)" % schema["@dataref"])
 
     temp_files = []
+    cpp_indexes = dict()
 
     with open(file, "r") as json_file:
+        if dependencies != None and file not in dependencies:
+            dependencies.append(file)
+
+        def _NotFound(ref_file):
+            # The files looked for but not found are dependencies, too: one appearing changes what's loaded
+            if dependencies != None and ref_file not in dependencies:
+                dependencies.append(ref_file)
+
         def Preprocess(pairs):
             def Scan(pairs):
                 for i, c in enumerate(pairs):
@@ -1207,6 +1308,7 @@ def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths):
                                             break
                                         else:
                                             log.Info("failed to include '%s', file not found" % rf)
+                                            _NotFound(rf)
                                 else:
                                     rf = os.path.abspath(os.path.dirname(file)) + os.sep + ref[0]
 
@@ -1214,6 +1316,7 @@ def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths):
                                         ref_file = rf
                                     else:
                                         log.Info("failed to include '%s', file not found" % rf)
+                                        _NotFound(rf)
 
                                         for p in include_paths:
                                             rf = os.path.abspath(p) + os.sep + ref[0]
@@ -1221,11 +1324,17 @@ def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths):
                                             if os.path.exists(rf):
                                                 ref_file = rf
                                                 break
+                                            else:
+                                                _NotFound(rf)
                                         else:
                                             log.Info("failed to include '%s', file not found" % rf)
 
                                 if ref_file:
                                     log.Info("including JSON file '%s'..." % rf);
+
+                                    if (dependencies != None) and (ref_file not in dependencies):
+                                        dependencies.append(ref_file)
+
                                     pairs[i] = (k, os.path.normpath("file://" + ref_file + "#" + ref[1]))
                                 else:
                                     raise IOError("$ref file '%s' not found in any of the interface paths" % ref[0])
@@ -1246,10 +1355,11 @@ def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths):
                                             break
                                         else:
                                             log.Info("failed to include '%s', file not found" %rf);
+                                            _NotFound(rf)
 
                                 if ref_file:
                                     log.Info("including C++ header '%s'..." % rf);
-                                    cppif, _ = header_loader.LoadInterface(ref_file, log, True, header_include_paths)
+                                    cppif, _ = header_loader.LoadInterface(ref_file, log, True, header_include_paths, dependencies)
 
                                     if cppif:
                                         if ref_file not in additional_includes:
@@ -1283,15 +1393,123 @@ def LoadSchema(file, include_paths, cpp_include_paths, header_include_paths):
 
     return [], [], temp_files
 
-def Load(log, path, if_dirs = [], cpp_if_dirs = [], include_paths = []):
+def Load(log, path, if_dirs = [], cpp_if_dirs = [], include_paths = [], dependencies = None, tree = None):
+    # If a dependencies list is provided it's filled with all the files read while loading
+    # (and the optional ones looked for but not found),
+    # for C++ headers an already parsed tree may be provided
     temp_files = []
 
-    if_dirs.append(os.path.dirname(path))
-    cpp_if_dirs.append(os.path.dirname(path))
+    # The directory of the source file is searched, too; the lists passed are not modified,
+    # so that the search paths of a file don't depend on the files loaded before it
+    if_dirs = if_dirs + [os.path.dirname(path)]
+    cpp_if_dirs = cpp_if_dirs + [os.path.dirname(path)]
 
     if path.endswith(".h"):
-        schemas, additional_includes = header_loader.LoadInterface(path, log, False, include_paths)
+        schemas, additional_includes = header_loader.LoadInterface(path, log, False, include_paths, dependencies, tree)
+    elif document_cache != None:
+        schemas, additional_includes = _LoadCached(path, if_dirs, cpp_if_dirs, include_paths, dependencies)
     else:
-        schemas, additional_includes, temp_files = LoadSchema(path, if_dirs, cpp_if_dirs, include_paths)
+        schemas, additional_includes, temp_files = LoadSchema(path, if_dirs, cpp_if_dirs, include_paths, dependencies)
 
     return schemas, additional_includes, temp_files
+
+def Scan(path, if_dirs = []):
+    # Outlines of the schemas Load() would return, only enough to name the files generated from them
+    # (see --list-outputs): a header is just scanned, of a JSON document only the interface it refers to is loaded
+    if path.endswith(".h"):
+        return header_loader.ScanInterface(path)
+
+    if_dirs = if_dirs + [os.path.dirname(path)]
+
+    with open(path, "r") as json_file:
+        schema = json.load(json_file, object_pairs_hook=OrderedDict)
+
+    face = schema.get("interface") if isinstance(schema, dict) else None
+
+    if isinstance(face, dict):
+        ref = face.get("$ref", face.get("$cppref", ""))
+
+        if ".json" in ref:
+            ref = ref.split("#") if "#" in ref else [ref, ""]
+
+            if "{interfacedir}" in ref[0]:
+                candidates = [ref[0].replace("{interfacedir}", p) for p in if_dirs]
+            else:
+                candidates = [os.path.abspath(os.path.dirname(path)) + os.sep + ref[0]] + [os.path.abspath(p) + os.sep + ref[0] for p in if_dirs]
+
+            ref_file = next((rf for rf in candidates if os.path.exists(rf)), None)
+
+            if not ref_file:
+                raise IOError("$ref file '%s' not found in any of the interface paths" % ref[0])
+
+            with open(ref_file, "r") as json_file:
+                face = json.load(json_file, object_pairs_hook=OrderedDict)
+
+            for element in ref[1].split("/"):
+                if element:
+                    face = face[element]
+
+            schema["interface"] = face
+
+        elif ref.endswith(".h") or ref.endswith(".h#"):
+            # The interfaces of a header are included as a list, no code is generated for them
+            schema["interface"] = []
+
+    return [schema]
+
+def _Copy(data, memo):
+    # Elements shared in the document (e.g. referenced definitions) are shared in the copy, too
+    subject = data.__subject__ if isinstance(data, jsonref.JsonRef) else data
+
+    if isinstance(subject, (dict, list)):
+        if id(subject) not in memo:
+            if isinstance(subject, dict):
+                memo[id(subject)] = OrderedDict() if isinstance(subject, OrderedDict) else dict()
+                memo[id(subject)].update([(k, _Copy(v, memo)) for k, v in subject.items()])
+            else:
+                memo[id(subject)] = []
+                memo[id(subject)].extend([_Copy(v, memo) for v in subject])
+
+        return memo[id(subject)]
+    else:
+        return subject
+
+def Resolved(schemas):
+    # A copy of loaded schemas with all the references resolved, not needing the temporary files anymore;
+    # the generators modify the documents, so one that is processed more than once has to be copied
+    return _Copy(schemas, dict())
+
+def _LoadCached(path, if_dirs, cpp_if_dirs, include_paths, dependencies):
+    # Same as LoadSchema(), but reuses the document loaded previously if none of the files it was loaded from
+    # (or the optional ones not found) has changed since; the configuration is part of the key, as it affects loading
+    def _Timestamp(f):
+        return (os.path.getmtime(f) if os.path.exists(f) else None)
+
+    key = (os.path.abspath(path), tuple(if_dirs), tuple(cpp_if_dirs), tuple(include_paths),
+                tuple(sorted([(k, repr(v)) for k, v in vars(config).items() if k.isupper()])))
+
+    entry = document_cache.get(key)
+
+    if entry and all([(_Timestamp(f) == t) for f, t in entry[2]]):
+        # The callers modify the documents, so hand out copies
+        schemas, additional_includes = Resolved(entry[0]), list(entry[1])
+    else:
+        files = []
+        messages = len(log.warnings) + len(log.errors)
+
+        schemas, additional_includes, temp_files = LoadSchema(path, if_dirs, cpp_if_dirs, include_paths, files)
+
+        # Keep a copy with all the references resolved, so that the temporary files are not needed anymore
+        entry = (Resolved(schemas), list(additional_includes), [(f, _Timestamp(f)) for f in files])
+
+        for tf in temp_files:
+            os.remove(tf)
+
+        # Don't keep documents that produced warnings, these would not be reported again
+        if (len(log.warnings) + len(log.errors)) == messages:
+            document_cache[key] = entry
+
+    if dependencies != None:
+        dependencies.extend([f for f, _ in entry[2] if f not in dependencies])
+
+    return schemas, additional_includes
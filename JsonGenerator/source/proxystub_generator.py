@@ -0,0 +1,85 @@
+# If not stated otherwise in this file or this component's license file the
+# following copyright and licenses apply:
+#
+# Copyright 2020 Metrological
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Runs the proxy/stub emitter of StubGenerator on a C++ tree parsed by the header loader,
+# so that a header is parsed only once for both COM-RPC and JSON-RPC code.
+
+import sys
+import os
+
+import config
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir + os.sep + os.pardir))
+
+import ProxyStubGenerator.StubGenerator as StubGenerator
+
+def ExtraIncludes(source_file):
+    # Interface IDs are needed for the proxy stubs (optional)
+    return [os.path.join("@" + os.path.dirname(source_file), StubGenerator.IDS_DEFINITIONS_FILE)]
+
+def _Setup(log, source_file):
+    StubGenerator.log = log
+    StubGenerator.source_file = source_file
+    StubGenerator.FORCE = config.FORCE
+    StubGenerator.INDENT_SIZE = config.INDENT_SIZE
+    StubGenerator.FRAMEWORK_NAMESPACE = config.FRAMEWORK_NAMESPACE
+    StubGenerator.STUB_NAMESPACE = "::%s::ProxyStubs" % config.FRAMEWORK_NAMESPACE
+    StubGenerator.INTERFACE_NAMESPACES = ["::%s" % config.FRAMEWORK_NAMESPACE]
+    StubGenerator.CLASS_IUNKNOWN = "::%s::Core::IUnknown" % config.FRAMEWORK_NAMESPACE
+
+def _OutputFile(source_file, path):
+    return os.path.join(path, StubGenerator.PROXYSTUB_CPP_NAME % StubGenerator.CreateName(os.path.basename(source_file)).split(".", 1)[0])
+
+def ListOutputs(log, source_file, path):
+    # Only scans the header for interfaces, returns the file Create() would write (or None)
+    _Setup(log, source_file)
+
+    output_file = _OutputFile(source_file, path)
+    classes = StubGenerator.Scanner.Scan(source_file, StubGenerator.FRAMEWORK_NAMESPACE)
+
+    for ns in StubGenerator.INTERFACE_NAMESPACES:
+        if StubGenerator.FindScannedInterfaceClasses(classes, ns):
+            return output_file
+
+    return None
+
+def Create(log, tree, source_file, path):
+    _Setup(log, source_file)
+
+    output_file = _OutputFile(source_file, path)
+
+    try:
+        faces = []
+
+        for ns in StubGenerator.INTERFACE_NAMESPACES:
+            output, _ = StubGenerator.GenerateStubs2(output_file, source_file, tree, ns)
+            faces += output
+
+        if faces:
+            log.Success("Proxy stubs generated in %s" % os.path.basename(output_file))
+        else:
+            log.Info("No proxy stubs generated for %s" % os.path.basename(source_file))
+
+    except StubGenerator.NotModifiedException:
+        log.Success("skipping file %s, up-to-date" % os.path.basename(output_file))
+    except StubGenerator.TypenameError as err:
+        log.Error(str(err))
+
+        if os.path.isfile(output_file):
+            os.remove(output_file)
+
+    return (output_file if os.path.isfile(output_file) else None)
@@ -19,7 +19,6 @@ import copy
 from collections import OrderedDict
 
 import config
-import emitter
 import rpc_version
 from json_loader import *
 from class_emitter import Restrictions
@@ -42,6 +41,8 @@ def EmitEvent(emit, root, event, params_type, legacy = False):
     names['designator'] = "_designator"
     names['sendif'] = "_sendIfMethod"
     names['index'] = "_designatorId"
+    names['text'] = "_text"
+    names['message'] = "_message"
     names['jsonrpc_alias'] = "PluginHost::JSONRPC"
 
     prefix = ("%s." % names.module) if not legacy else ""
@@ -150,6 +151,16 @@ def EmitEvent(emit, root, event, params_type, legacy = False):
         if not params.is_void:
             parameters.append(names.params if legacy else params.local_name)
 
+            if config.SERIALIZE_EVENTS_ONCE and config.LEGACY_ALT and event.alternative:
+                # The event is sent twice, so serialize the parameters only once and pass the text on verbatim
+                emit.Line("string %s;" % names.text)
+                emit.Line("%s.ToString(%s);" % (parameters[-1], names.text))
+                emit.Line("Core::JSON::String %s;" % names.message)
+                emit.Line("%s = %s;" % (names.message, names.text))
+                emit.Line("%s.SetQuoted(false);" % names.message)
+                emit.Line()
+                parameters[-1] = names.message
+
         if event.sendif_type:
             if not legacy:
                 # If the event has an id specified (i.e. uses "send-if"), generate code for this too:
@@ -301,6 +312,90 @@ def _EmitVersionCode(emit, version):
     emit.Line("} // namespace Version")
     emit.Line()
 
+def _EmitContiguousIterator(emit):
+    # Iterator implementation holding a contiguous copy of a JSON array, sized upfront from the array length
+    emit.Line("template<typename INTERFACE, typename ELEMENT>")
+    emit.Line("class _ContiguousIteratorType : public INTERFACE {")
+    emit.Line("public:")
+    emit.Indent()
+    emit.Line("_ContiguousIteratorType() = delete;")
+    emit.Line("_ContiguousIteratorType(const _ContiguousIteratorType&) = delete;")
+    emit.Line("_ContiguousIteratorType(_ContiguousIteratorType&&) = delete;")
+    emit.Line("_ContiguousIteratorType& operator=(const _ContiguousIteratorType&) = delete;")
+    emit.Line("_ContiguousIteratorType& operator=(_ContiguousIteratorType&&) = delete;")
+    emit.Line()
+    emit.Line("template<typename ARRAY>")
+    emit.Line("explicit _ContiguousIteratorType(const ARRAY& array)")
+    emit.Line("    : _container()")
+    emit.Line("    , _index(0)")
+    emit.Line("{")
+    emit.Indent()
+    emit.Line("_container.reserve(array.Length());")
+    emit.Line("auto it = array.Elements();")
+    emit.Line("while (it.Next() == true) { _container.push_back(it.Current()); }")
+    emit.Unindent()
+    emit.Line("}")
+    emit.Line()
+    emit.Line("~_ContiguousIteratorType() override = default;")
+    emit.Line()
+    emit.Unindent()
+    emit.Line("public:")
+    emit.Indent()
+    emit.Line("bool Next(ELEMENT& result) override")
+    emit.Line("{")
+    emit.Indent()
+    emit.Line("if (_index <= Count()) { _index++; }")
+    emit.Line("if (IsValid() == true) { result = _container[_index - 1]; }")
+    emit.Line("return (IsValid());")
+    emit.Unindent()
+    emit.Line("}")
+    emit.Line("bool Previous(ELEMENT& result) override")
+    emit.Line("{")
+    emit.Indent()
+    emit.Line("if (_index != 0) { _index--; }")
+    emit.Line("if (IsValid() == true) { result = _container[_index - 1]; }")
+    emit.Line("return (IsValid());")
+    emit.Unindent()
+    emit.Line("}")
+    emit.Line("void Reset(const uint32_t position) override")
+    emit.Line("{")
+    emit.Indent()
+    emit.Line("_index = (position > Count() ? (Count() + 1) : position);")
+    emit.Unindent()
+    emit.Line("}")
+    emit.Line("bool IsValid() const override")
+    emit.Line("{")
+    emit.Indent()
+    emit.Line("return ((_index > 0) && (_index <= Count()));")
+    emit.Unindent()
+    emit.Line("}")
+    emit.Line("uint32_t Count() const override")
+    emit.Line("{")
+    emit.Indent()
+    emit.Line("return (static_cast<uint32_t>(_container.size()));")
+    emit.Unindent()
+    emit.Line("}")
+    emit.Line("ELEMENT Current() const override")
+    emit.Line("{")
+    emit.Indent()
+    emit.Line("ASSERT(IsValid() == true);")
+    emit.Line("return (_container[_index - 1]);")
+    emit.Unindent()
+    emit.Line("}")
+    emit.Line()
+    emit.Line("BEGIN_INTERFACE_MAP(_ContiguousIteratorType)")
+    emit.Line("    INTERFACE_ENTRY(INTERFACE)")
+    emit.Line("END_INTERFACE_MAP")
+    emit.Line()
+    emit.Unindent()
+    emit.Line("private:")
+    emit.Indent()
+    emit.Line("std::vector<ELEMENT> _container;")
+    emit.Line("uint32_t _index;")
+    emit.Unindent()
+    emit.Line("}; // class _ContiguousIteratorType")
+    emit.Line()
+
 def _EmitRpcCode(root, emit, ns, header_file, source_file, data_emitted):
 
     def _EmitHandlerInterface(listener_events):
@@ -438,6 +533,10 @@ def _EmitRpcCode(root, emit, ns, header_file, source_file, data_emitted):
 
     _EmitNoPushWarnings(prologue=True)
 
+    # Filled in at the end, if any iterator is created from a JSON array (see --contiguous-iterators)
+    contiguous_iterators = emit.Slot() if config.CONTIGUOUS_ITERATORS else None
+    contiguous_iterators_used = []
+
     if is_json_source:
         emit.Line("using JSONRPC = %s;" % names.jsonrpc_alias)
         emit.Line()
@@ -756,12 +855,19 @@ def _EmitRpcCode(root, emit, ns, header_file, source_file, data_emitted):
                             iterator_name = arg.items.TempName("iterator")
                             impl_name = "_" + arg.items.local_name.capitalize() + "IteratorImplType"
 
-                            emit.Line("std::list<%s> %s{};" % (arg.items.cpp_native_type, elements_name))
-                            emit.Line("auto %s = %s.Elements();" % (iterator_name, cpp_name))
-                            emit.Line("while (%s.Next() == true) { %s.push_back(%s.Current()); }" % (iterator_name, elements_name, iterator_name))
-                            impl = (arg.iterator[:arg.iterator.index('<')].replace("IIterator", "Iterator") + ("<%s>" % face_name))
-                            emit.Line("using %s = %s;" % (impl_name, impl))
-                            initializer = "Core::ServiceType<%s>::Create<%s>(std::move(%s))" % (impl_name, face_name, elements_name)
+                            if contiguous_iterators:
+                                # The elements are copied straight from the JSON array, no intermediate list needed
+                                contiguous_iterators_used.append(face_name)
+                                emit.Line("using %s = _ContiguousIteratorType<%s, %s>;" % (impl_name, face_name, arg.items.cpp_native_type))
+                                initializer = "Core::ServiceType<%s>::Create<%s>(%s)" % (impl_name, face_name, cpp_name)
+                            else:
+                                emit.Line("std::list<%s> %s{};" % (arg.items.cpp_native_type, elements_name))
+                                emit.Line("auto %s = %s.Elements();" % (iterator_name, cpp_name))
+                                emit.Line("while (%s.Next() == true) { %s.push_back(%s.Current()); }" % (iterator_name, elements_name, iterator_name))
+                                impl = (arg.iterator[:arg.iterator.index('<')].replace("IIterator", "Iterator") + ("<%s>" % face_name))
+                                emit.Line("using %s = %s;" % (impl_name, impl))
+                                initializer = "Core::ServiceType<%s>::Create<%s>(std::move(%s))" % (impl_name, face_name, elements_name)
+
                             if arg.optional and is_readable:
                                 emit.Line("%s = %s;" % (arg.temp_name, initializer))
                             else:
@@ -1224,6 +1330,11 @@ def _EmitRpcCode(root, emit, ns, header_file, source_file, data_emitted):
     if events:
         _EmitEvents(events)
 
+    if contiguous_iterators:
+        with contiguous_iterators:
+            if contiguous_iterators_used:
+                _EmitContiguousIterator(contiguous_iterators)
+
     # Restore warnings level
     _EmitNoPushWarnings(prologue=False)
 
@@ -1235,11 +1346,13 @@ def __Namespace(root):
 
 def EmitRpcCode(root, emit, header_file, source_file, data_emitted):
     _namespace = __Namespace(root)
+
+    # The prologue depends on the prototypes collected while emitting the code
+    prologue = emit.Slot()
     prototypes = _EmitRpcCode(root, emit, _namespace, header_file, source_file, data_emitted)
 
-    with emitter.Emitter(None, config.INDENT_SIZE) as prototypes_emitter:
-        _EmitRpcPrologue(root, prototypes_emitter, header_file, source_file, _namespace, data_emitted, prototypes)
-        emit.Prepend(prototypes_emitter)
+    with prologue:
+        _EmitRpcPrologue(root, prologue, header_file, source_file, _namespace, data_emitted, prototypes)
 
     _EmitRpcEpilogue(root, emit, _namespace)
 
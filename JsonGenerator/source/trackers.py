@@ -15,6 +15,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+
 import config
 import logger
 from json_loader import *
@@ -263,6 +265,73 @@ class EnumTracker(ObjectTracker):
     def CommonObjects(self):
         return SortByDependency(filter(lambda obj: ((obj.RefCount() > 1) or self._IsTopmost(obj)), self.objects))
 
+# Objects found identical in several source files of a run, emitted once in a shared header (see --shared-objects)
+shared_objects = dict() # signature -> class name
+
+def SharedSignature(obj):
+    # Only the classes made of plain members and not bound to a C++ type can be shared as they are,
+    # and these are taken only if all their properties are exactly the same (apart from the descriptions)
+    def _Strip(schema):
+        if isinstance(schema, dict):
+            return dict([(k, _Strip(v)) for k, v in schema.items() if k not in ["description", "summary", "example"]])
+        else:
+            return schema
+
+    if not isinstance(obj, JsonObject) or isinstance(obj, JsonMethod) or isinstance(obj.parent, JsonMethod):
+        return None
+
+    if obj.is_duplicate or not obj.do_create or obj.included_from or not obj.properties:
+        return None
+
+    if [p for p in obj.properties if not isinstance(p, (JsonString, JsonInteger, JsonNumber, JsonBoolean))]:
+        return None
+
+    return json.dumps(_Strip(obj.schema["properties"]), sort_keys=True, default=str)
+
+def CollectSharedObjects(objects):
+    # Takes the objects seen in the source files, as a list of (file, object) pairs;
+    # returns the objects to be emitted in the shared header
+    seen = dict()
+
+    for path, obj in objects:
+        signature = SharedSignature(obj)
+
+        if signature:
+            if signature not in seen:
+                seen[signature] = (obj, set())
+
+            seen[signature][1].add(path)
+
+    shared_objects.clear()
+    result = []
+    names = []
+
+    for signature, (obj, paths) in seen.items():
+        # Different classes that happen to have the same name stay where they are
+        if (len(paths) > 1) and (obj.cpp_class not in names):
+            shared_objects[signature] = obj.cpp_class
+            names.append(obj.cpp_class)
+            result.append(obj)
+
+    return result
+
+def MarkSharedObjects(root):
+    # Makes the objects of the schema that are in the shared header refer to it
+    marked = False
+
+    for obj in object_tracker.objects:
+        signature = SharedSignature(obj)
+
+        if signature and (signature in shared_objects):
+            obj.shared_class = shared_objects[signature]
+            marked = True
+
+    if marked:
+        # The names of the classes are cached all over the tree
+        root.InvalidateCache()
+
+    return marked
+
 def SetLogger(logger):
     global log
     log = logger
@@ -0,0 +1,182 @@
+# If not stated otherwise in this file or this component's license file the
+# following copyright and licenses apply:
+#
+# Copyright 2020 Metrological
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+# Content-addressed cache of generated files, shared by all the build trees pointing to the same cache directory
+#
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+CACHE_DIR_ENV = "THUNDERTOOLS_CACHE_DIR"
+
+MAX_MANIFEST_ENTRIES = 16
+
+
+def _Digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _FileDigest(path):
+    try:
+        with open(path, "rb") as file:
+            return _Digest(file.read())
+    except OSError:
+        return None
+
+
+def _Write(path, data):
+    # Write to a temporary file and move it in place, so that concurrent builds never see partial files
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as file:
+        file.write(data)
+
+    os.replace(file.name, path)
+
+
+class Cache:
+    def __init__(self, directory, log, tool_dirs, options, roots={}):
+        # Any change to the generator code itself or to the options affecting the output invalidates the entries;
+        # the inputs are recorded relative to the roots (e.g. the include paths, by option name and position),
+        # so that the entries can be shared between build trees with a different location
+        self.directory = directory
+        self.log = log
+        self.hits = 0
+        self.misses = 0
+
+        version = hashlib.sha256()
+
+        for tool_dir in tool_dirs:
+            for name in sorted(os.listdir(tool_dir)):
+                if name.endswith((".py", ".h", ".json")):
+                    version.update(_FileDigest(os.path.join(tool_dir, name)).encode())
+
+        self.prefix = version.hexdigest() + json.dumps(options, sort_keys=True, default=str)
+        self.roots = dict([(role, os.path.abspath(d)) for role, d in roots.items()])
+        self.roots.update([("tool%i" % i, os.path.abspath(d)) for i, d in enumerate(tool_dirs)])
+
+    def __Roots(self, source_file):
+        roots = dict(self.roots)
+        roots["source"] = os.path.dirname(os.path.abspath(source_file))
+        return roots
+
+    def __Relative(self, f, roots):
+        # Maps a file to the innermost root holding it; files outside of all the roots are kept as they are
+        f = os.path.abspath(f)
+        role = max([r for r, d in roots.items() if f.startswith(os.path.join(d, ""))], key=lambda r: len(roots[r]), default=None)
+
+        return [role, (os.path.relpath(f, roots[role]) if role else f)]
+
+    def __Manifest(self, source_file):
+        # The name of the source file matters, it's used in the names and the contents of the outputs
+        key = _Digest((self.prefix + os.path.basename(source_file) + str(_FileDigest(source_file))).encode())
+        return os.path.join(self.directory, "manifests", key[:2], key + ".json")
+
+    def __Blob(self, digest):
+        return os.path.join(self.directory, "blobs", digest[:2], digest)
+
+    def Lookup(self, source_file, directories):
+        # Materializes the outputs of the source file if all the inputs it was generated from are unchanged;
+        # returns the inputs, outputs and warnings of the original run, or None on a miss
+        try:
+            with open(self.__Manifest(source_file)) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            manifest = []
+
+        roots = self.__Roots(source_file)
+
+        for entry in reversed(manifest):
+            # Inputs not found when the entry was made have no digest, they must not be found now either
+            if all([(not role or role in roots) for role, _, _ in entry["inputs"]]):
+                inputs = [(os.path.join(roots[role], f) if role else f) for role, f, _ in entry["inputs"]]
+            else:
+                continue
+
+            if all([(_FileDigest(f) == digest) for f, (_, _, digest) in zip(inputs, entry["inputs"])]) and all([(role in directories) for role, _, _ in entry["outputs"]]):
+                try:
+                    newest_input = max([os.path.getmtime(f) for f in inputs if os.path.exists(f)], default=0)
+                    outputs = []
+
+                    for role, name, digest in entry["outputs"]:
+                        output_file = os.path.join(directories[role], name)
+
+                        if _FileDigest(output_file) != digest:
+                            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+                            shutil.copyfile(self.__Blob(digest), output_file)
+                        elif os.path.getmtime(output_file) <= newest_input:
+                            os.utime(output_file)
+
+                        outputs.append(output_file)
+
+                    self.hits += 1
+                    return inputs, outputs, entry["warnings"]
+
+                except OSError as err:
+                    self.log.Warn("cache: %s" % err)
+                    break
+
+        self.misses += 1
+        return None
+
+    def Store(self, source_file, inputs, outputs, directories, warnings=[]):
+        # Maps each output to one of the output directories, so that it can be materialized in a different build tree
+        try:
+            entry = { "inputs": [], "outputs": [], "warnings": warnings }
+            roots = self.__Roots(source_file)
+
+            for f in dict.fromkeys([os.path.abspath(f) for f in inputs]):
+                entry["inputs"].append(self.__Relative(f, roots) + [_FileDigest(f)])
+
+            for output_file in dict.fromkeys(outputs):
+                role = next((r for r, d in directories.items() if os.path.abspath(d) == os.path.dirname(os.path.abspath(output_file))), None)
+
+                if not role:
+                    # Not a known output location, can't be cached
+                    return
+
+                with open(output_file, "rb") as file:
+                    data = file.read()
+
+                digest = _Digest(data)
+
+                if not os.path.exists(self.__Blob(digest)):
+                    _Write(self.__Blob(digest), data)
+
+                entry["outputs"].append([role, os.path.basename(output_file), digest])
+
+            manifest_file = self.__Manifest(source_file)
+
+            try:
+                with open(manifest_file) as file:
+                    manifest = json.load(file)
+            except (OSError, ValueError):
+                manifest = []
+
+            manifest = [e for e in manifest if e["inputs"] != entry["inputs"]][-(MAX_MANIFEST_ENTRIES - 1):] + [entry]
+
+            _Write(manifest_file, json.dumps(manifest).encode())
+
+        except OSError as err:
+            self.log.Warn("cache: %s" % err)
+
+    def Statistics(self):
+        return "%i hit%s, %i miss%s" % (self.hits, "" if self.hits == 1 else "s", self.misses, "" if self.misses == 1 else "es")
@@ -67,6 +67,9 @@ def ASSERT_ISEXPECTED(token, list):
 
 global_namespace = None
 
+# Parsed trees kept by long-lived processes (e.g. the JsonGenerator daemon); disabled if None
+tree_cache = None
+
 
 class Ref(IntEnum):
     VALUE = 1
@@ -1052,6 +1055,7 @@ class Class(Identifier, Block):
         self.is_iterator = False
         self.sourcelocation = None
         self.type_name = name
+        self._merged = dict() # merged views, see Merge()
 
         if sum([1 for x in self.parent.classes if x.name == name]) == 0:
             self.parent.classes.append(self)
@@ -1068,7 +1072,21 @@ class Class(Identifier, Block):
     def Proto(self):
         return self.full_name
 
-    def _Merge(self, vars, methods, do_methods=False, virtual=False):
+    def __deepcopy__(self, memo):
+        # Copies of a class share the merged views, these are built only once (see Merge())
+        new_class = copy.copy(self)
+        memo[id(self)] = new_class
+
+        for key, value in self.__dict__.items():
+            if key != "_merged":
+                setattr(new_class, key, copy.deepcopy(value, memo))
+
+        return new_class
+
+    def _Merge(self, vars, methods, do_methods=False, virtual=False, members=None):
+        if members == None:
+            members = dict([(v.name, v) for v in vars])
+
         for a in self.ancestors:
             if isinstance(a[0].type, Class):
                 access = a[1]
@@ -1076,20 +1094,20 @@ class Class(Identifier, Block):
                 is_virtual = "virtual" in a[2]
 
                 if access == "public":
-                    kind._Merge(vars, methods, do_methods, is_virtual)
+                    kind._Merge(vars, methods, do_methods, is_virtual, members)
                 else:
                     raise ParserError("public inheritance of %s is required" % kind.full_name)
 
         def Populate(array, are_methods=False):
             for v in array:
                 if v.access == "public":
-                    found = list(filter(lambda x: x.name == v.name, vars))
-                    assert len(found)<=1
+                    found = members.get(v.name)
 
                     if not found:
                         vars.append(v)
+                        members[v.name] = v
                         v._virtual = virtual
-                    elif not found[0]._virtual or not virtual:
+                    elif not found._virtual or not virtual:
                         raise ParserError("ambiguous %s %s (use virtual inhertiance?)" % ("method" if are_methods else "attributes", v.full_name))
                 else:
                     raise ParserError("all members are reqired to be public, non-public member %s" % v.full_name)
@@ -1100,9 +1118,14 @@ class Class(Identifier, Block):
             Populate(self.methods, True)
 
     def Merge(self, do_methods=False):
-        new_class = Class(self.parent, self.name)
-        self._Merge(new_class.vars, new_class.methods, do_methods)
-        return new_class
+        # The merged view is built once and then reused (also by the copies of the class),
+        # it must not be modified by the caller
+        if do_methods not in self._merged:
+            new_class = Class(self.parent, self.name)
+            self._Merge(new_class.vars, new_class.methods, do_methods)
+            self._merged[do_methods] = new_class
+
+        return self._merged[do_methods]
 
     def __str__(self):
         return "class " + self.Proto()
@@ -2492,12 +2515,14 @@ def Parse(contents,log = None):
 # -------------------------------------------------------------------------
 
 
-def ReadFile(source_file, includePaths, quiet=False, initial="", omit=False):
+def ReadFile(source_file, includePaths, quiet=False, initial="", omit=False, dependencies=None):
     contents = initial
     global current_file
     try:
         with open(source_file) as file:
             file_content = file.read()
+            if dependencies != None and source_file not in dependencies:
+                dependencies.append(source_file)
             pos = 0
             while True:
                 idx = file_content.find("@stubgen:include", pos)
@@ -2513,7 +2538,7 @@ def ReadFile(source_file, includePaths, quiet=False, initial="", omit=False):
                             if os.path.isfile(tryPath):
                                 prev = current_file
                                 current_file = source_file
-                                contents += ReadFile(tryPath, includePaths, False, contents, True)
+                                contents += ReadFile(tryPath, includePaths, False, contents, True, dependencies)
                                 current_file = prev
                             else:
                                 raise LoaderError(source_file, "can't include '%s', file does not exist" % tryPath)
@@ -2528,9 +2553,12 @@ def ReadFile(source_file, includePaths, quiet=False, initial="", omit=False):
                                 if os.path.isfile(tryPath):
                                     prev = current_file
                                     current_file = source_file
-                                    contents += ReadFile(tryPath, includePaths, True, contents, True)
+                                    contents += ReadFile(tryPath, includePaths, True, contents, True, dependencies)
                                     current_file = prev
                                     found = True
+                                elif dependencies != None and tryPath not in dependencies:
+                                    # Looked for but not found, the file appearing later changes the outcome
+                                    dependencies.append(tryPath)
                             if not found:
                                 raise LoaderError(source_file, "can't find '%s' in any of the include paths" % match.group(1))
                         else:
@@ -2572,20 +2600,96 @@ def Locate(block_name, tree=None):
     return None
 
 
+# Holds what interface discovery needs to know about a class
+class ClassIndexEntry:
+    def __init__(self, obj):
+        self.obj = obj
+        self.full_name = obj.full_name
+        self.is_template = isinstance(obj, TemplateClass)
+        self.ancestors = [str(a[0]) for a in obj.ancestors]
+        self.ids = [] # values of the ID enumerators (first one in each unscoped enum)
+
+        for e in obj.enums:
+            if not e.scoped:
+                for item in e.items:
+                    if item.name == "ID":
+                        self.ids.append(item.value)
+                        break
+
+    def Inherits(self, class_name):
+        return any([(class_name in a) for a in self.ancestors])
+
+
+# All the classes (including nested ones) in a tree, in declaration order; built only once per tree
+def ClassIndex(tree):
+    index = getattr(tree, "_class_index", None)
+
+    if index == None:
+        index = []
+
+        def _Traverse(block):
+            if isinstance(block, (Namespace, Class)):
+                for c in block.classes:
+                    index.append(ClassIndexEntry(c))
+                    _Traverse(c)
+
+            if isinstance(block, Namespace):
+                for n in block.namespaces:
+                    _Traverse(n)
+
+        _Traverse(tree)
+        tree._class_index = index
+
+    return index
+
+
 def ParseFile(source_file, includePaths = []):
     contents = ReadFile(source_file, includePaths)
     return Parse(contents)
 
 
-def ParseFiles(source_files, framework_namespace, includePaths = [], log = None):
+def ParseFiles(source_files, framework_namespace, includePaths = [], log = None, dependencies = None):
+    global global_namespace
+
+    def _Timestamp(f):
+        return (os.path.getmtime(f) if os.path.exists(f) else None)
+
+    if tree_cache != None:
+        key = (tuple(source_files), framework_namespace, tuple(includePaths))
+        entry = tree_cache.get(key)
+
+        # The tree is reused only if none of the files read (or the optional ones not found) has changed since
+        if entry and all([(_Timestamp(f) == t) for f, t in entry[1]]):
+            if dependencies != None:
+                dependencies.extend([f for f, _ in entry[1] if f not in dependencies])
+
+            global_namespace = entry[0]
+            return global_namespace
+
+    files_read = []
     contents = ""
     for source_file in source_files:
         if source_file:
             quiet = (source_file[0] == "@")
-            contents += ReadFile((source_file[1:] if quiet else source_file), includePaths, quiet, "")
+            contents += ReadFile((source_file[1:] if quiet else source_file), includePaths, quiet, "", False, files_read)
             contents = contents.replace("__FRAMEWORK_NAMESPACE__", framework_namespace)
 
-    return Parse(contents, log)
+            if quiet and source_file[1:] not in files_read:
+                files_read.append(source_file[1:])
+
+    # The optional files not found are kept, too
+    if dependencies != None:
+        dependencies.extend([f for f in files_read if f not in dependencies])
+
+    messages = (len(log.warnings) + len(log.errors)) if log else 0
+
+    tree = Parse(contents, log)
+
+    # Don't keep trees that produced warnings, these would not be reported again
+    if tree_cache != None and (not log or ((len(log.warnings) + len(log.errors)) == messages)):
+        tree_cache[key] = (tree, [(f, _Timestamp(f)) for f in files_read])
+
+    return tree
 
 
 # -------------------------------------------------------------------------
@@ -28,49 +28,17 @@ class Interface():
 # Looks for interface clasess (ie. classes inheriting from Core::Unknown and specifying ID enum).
 def FindInterfaceClasses(tree, interface_namespace, source_file, ancestors):
     interfaces = []
-    selected = []
 
-    def __Traverse(tree, faces):
-        if isinstance(tree, CppParser.Namespace) or isinstance(tree, CppParser.Class):
-            for c in tree.classes:
-                if not isinstance(c, CppParser.TemplateClass):
-                    if (interface_namespace + "::") in c.full_name:
-                        inherits = False
-
-                        for t in ancestors:
-                            for a in c.ancestors:
-                                if t in str(a[0]):
-                                    inherits = True
-                                    break
-                            if inherits:
-                                break
-
-                        appended = False
-
-                        if ancestors:
-                            if inherits:
-                                for e in c.enums:
-                                    if not e.scoped:
-                                        for item in e.items:
-                                            if item.name == "ID":
-                                                faces.append(Interface(c, item.value, source_file))
-                                                selected.append(c.full_name)
-                                                appended = True
-                                                break
-
-                                if not appended:
-                                    faces.append(Interface(c, 0, source_file))
-                                    selected.append(c.full_name)
-                        else:
-                            faces.append(Interface(c, 0, source_file))
-                            selected.append(c.full_name)
-
-                __Traverse(c, faces)
-
-        if isinstance(tree, CppParser.Namespace):
-            for n in tree.namespaces:
-                __Traverse(n, faces)
-
-    __Traverse(tree, interfaces)
+    for entry in CppParser.ClassIndex(tree):
+        if not entry.is_template and ((interface_namespace + "::") in entry.full_name):
+            if ancestors:
+                if any([entry.Inherits(t) for t in ancestors]):
+                    for iid in entry.ids:
+                        interfaces.append(Interface(entry.obj, iid, source_file))
+
+                    if not entry.ids:
+                        interfaces.append(Interface(entry.obj, 0, source_file))
+            else:
+                interfaces.append(Interface(entry.obj, 0, source_file))
 
     return interfaces
@@ -0,0 +1,221 @@
+# If not stated otherwise in this file or this component's license file the
+# following copyright and licenses apply:
+#
+# Copyright 2020 Metrological
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+# Quick scan of an interface header for the classes it declares, for the --list-outputs mode of the generators;
+# only the file itself is tokenized, nothing is included, parsed or resolved
+#
+
+import re
+
+TOKENS = re.compile(r"//[^\n]*|/\*.*?\*/|\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*'|#(?:\\\n|[^\n])*"
+                    r"|(?:::\s*)?[A-Za-z_]\w*(?:\s*::\s*[A-Za-z_]\w*)*|\S", re.S)
+
+ACCESS = ["public", "protected", "private", "virtual"]
+
+
+def _Tag(word, comment):
+    # Same matching as in the parser
+    return re.compile(r"[ \r\n/\*]({0})([-: \r\n\*]|$)".format(word)).search(comment) != None
+
+
+class ScannedClass:
+    def __init__(self, name, scope, ancestors, tags, is_template):
+        self.name = name
+        self.full_name = "::" + "::".join([s for s in scope] + [name])
+        self.parent_name = scope[-1] if scope else ""
+        self.parent_full_name = "::" + "::".join(scope)
+        self.ancestors = ancestors # as written
+        self.is_template = is_template
+        self.is_json = ("json" in tags)
+        self.is_event = ("event" in tags)
+        self.omit = ("omit" in tags)
+        self.has_id = False
+        self.methods = 0 # virtual methods that are not omitted, destructors excluded
+        self.lookups = [] # names of the classes returned by @lookup methods
+
+    def Inherits(self, class_name):
+        return any([(a.replace(" ", "").split("::")[-1] == class_name.split("::")[-1]) for a in self.ancestors])
+
+
+def Scan(source_file, framework_namespace):
+    # Returns the classes (including nested ones) defined in the file, in declaration order
+    with open(source_file) as file:
+        tokens = TOKENS.findall(file.read().replace("__FRAMEWORK_NAMESPACE__", framework_namespace))
+
+    classes = []
+    stack = [] # (name, class) of the enclosing blocks; name is None for blocks other than namespaces and classes
+    tags = set()
+    template = False
+    lookup = None
+    i = 0
+
+    def _Skip(i, opening, closing):
+        # Skips a bracketed sequence starting at tokens[i], returns the index past it
+        depth = 0
+
+        while i < len(tokens):
+            if tokens[i] == opening:
+                depth += 1
+            elif tokens[i] == closing:
+                depth -= 1
+
+                if depth == 0:
+                    break
+
+            i += 1
+
+        return i + 1
+
+    while i < len(tokens):
+        token = tokens[i]
+        owner = (stack[-1][1] if stack else None)
+
+        if token[:2] in ["//", "/*"]:
+            if _Tag("@stop", token) or ("@stubgen:skip" in token):
+                break
+
+            if _Tag("@json:omit", token):
+                pass
+            elif _Tag("@json", token):
+                tags.add("json")
+
+            if _Tag("@event", token):
+                tags.add("event")
+
+            if _Tag("@omit", token) or ("@stubgen:omit" in token):
+                tags.add("omit")
+
+            if _Tag("@lookup", token):
+                tags.add("lookup")
+
+        elif token[0] in "#\"'":
+            pass
+
+        elif token == "template" and i + 1 < len(tokens) and tokens[i + 1] == "<":
+            i = _Skip(i + 1, "<", ">")
+            template = True
+            continue
+
+        elif token == "namespace":
+            j = i + 1
+
+            while j < len(tokens) and tokens[j] not in ["{", ";", "="]:
+                j += 1
+
+            if j < len(tokens) and tokens[j] == "{":
+                name = "".join(tokens[i + 1:j]).replace(" ", "")
+                stack.append(((name if name else None), None))
+
+            i = j + 1
+            tags.clear()
+            continue
+
+        elif token == "enum":
+            j = i + 1
+
+            while j < len(tokens) and tokens[j] not in ["{", ";", "(", ")", "="]:
+                j += 1
+
+            if j < len(tokens) and tokens[j] == "{":
+                end = _Skip(j, "{", "}")
+
+                # Only the unscoped enums hold the interface ID
+                if owner and tokens[i + 1] not in ["class", "struct"]:
+                    if [k for k in range(j + 1, end - 1) if (tokens[k] == "ID") and (tokens[k - 1] in ["{", ","])]:
+                        owner.has_id = True
+
+                i = end
+            else:
+                i = j
+
+            tags.clear()
+            template = False
+            continue
+
+        elif token in ["class", "struct", "union"]:
+            j = i + 1
+
+            while j < len(tokens) and tokens[j] not in ["{", ";", "(", ")", "=", "*", "&", ":"]:
+                j += 1
+
+            if j < len(tokens) and tokens[j] in ["{", ":"]:
+                names = [t for t in tokens[i + 1:j] if (t[0].isalpha() or t[0] == "_") and t != "final"]
+                ancestors = []
+
+                if tokens[j] == ":":
+                    k = j + 1
+                    base = []
+
+                    while k < len(tokens) and tokens[k] != "{":
+                        if tokens[k] == "<":
+                            k = _Skip(k, "<", ">")
+                            continue
+                        elif tokens[k] == ",":
+                            ancestors.append(base)
+                            base = []
+                        elif tokens[k] not in ACCESS and tokens[k][:2] not in ["//", "/*"]:
+                            base.append(tokens[k])
+
+                        k += 1
+
+                    ancestors.append(base)
+                    j = k
+
+                if names and j < len(tokens):
+                    new_class = ScannedClass(names[-1].replace(" ", "").split("::")[-1], [n for n, _ in stack if n],
+                                             ["".join(b) for b in ancestors if b], tags, template)
+                    classes.append(new_class)
+                    stack.append((new_class.name, new_class))
+                    i = j + 1
+                    tags.clear()
+                    template = False
+                    continue
+
+            i = j
+            continue
+
+        elif token == "virtual" and isinstance(owner, ScannedClass):
+            if (i + 1 < len(tokens)) and (tokens[i + 1] != "~") and ("omit" not in tags):
+                owner.methods += 1
+
+            if "lookup" in tags:
+                lookup = []
+
+        elif token == "(":
+            if lookup != None and isinstance(owner, ScannedClass):
+                # The return type of a lookup method is the looked up interface
+                owner.lookups.extend([t.replace(" ", "").split("::")[-1] for t in lookup])
+
+            lookup = None
+
+        elif token in ["{", ";", "}"]:
+            if token == "{":
+                stack.append((None, None))
+            elif token == "}" and stack:
+                stack.pop()
+
+            tags.clear()
+            template = False
+            lookup = None
+
+        elif lookup != None and (token[0].isalpha() or token[0] == "_"):
+            lookup.append(token)
+
+        i += 1
+
+    return classes
@@ -28,8 +28,20 @@ import argparse
 import copy
 import glob
 from collections import OrderedDict
-import Log
-import CppParser
+
+if __package__:
+    # Imported as a part of the ProxyStubGenerator package (e.g. by JsonGenerator)
+    from . import Log
+    from . import CppParser
+    from . import Cache
+    from . import Watcher
+    from . import Scanner
+else:
+    import Log
+    import CppParser
+    import Cache
+    import Watcher
+    import Scanner
 
 NAME = "ProxyStubGenerator"
 
@@ -48,8 +60,9 @@ STUB_NAMESPACE = "::%s::ProxyStubs" % FRAMEWORK_NAMESPACE
 INTERFACE_NAMESPACES = ["::%s" % FRAMEWORK_NAMESPACE]
 CLASS_IUNKNOWN = "::%s::Core::IUnknown" % FRAMEWORK_NAMESPACE
 PROXYSTUB_CPP_NAME = "ProxyStubs_%s.cpp"
+PER_INTERFACE_FILES = False
 
-ENABLE_CUSTOM_ALLOCATOR = False
+STACK_BUFFER_THRESHOLD = None # bytes, above that temporary buffers are not allocated on stack
 ENABLE_SECURE = False
 ENABLE_INSTANCE_VERIFICATION = ENABLE_SECURE
 ENABLE_RANGE_VERIFICATION = ENABLE_SECURE
@@ -128,48 +141,23 @@ class Interface():
 # Looks for interface classes (ie. classes inheriting from Core::Unknown and specifying ID enum).
 def FindInterfaceClasses(tree, namespace):
     interfaces = []
-    omit_interface_used = False
-
-    def __Traverse(tree, interface_namespace, faces):
-        nonlocal omit_interface_used
-
-        if isinstance(tree, CppParser.Namespace) or isinstance(tree, CppParser.Class):
-
-            for c in tree.classes:
-                if c.omit:
-                    omit_interface_used = True
-
-                if not isinstance(c, CppParser.TemplateClass):
-                    if (c.full_name.startswith(interface_namespace + "::")):
-                        inherits_iunknown = False
-                        for a in c.ancestors:
-                            if CLASS_IUNKNOWN in str(a[0]):
-                                inherits_iunknown = True
-                                break
-
-                        if inherits_iunknown:
-                            has_id = False
+    index = CppParser.ClassIndex(tree)
+    omit_interface_used = any([entry.obj.omit for entry in index])
 
-                            for e in c.enums:
-                                if not e.scoped:
-                                    for item in e.items:
-                                        if item.name == "ID":
-                                            faces.append(Interface(c, item.value, source_file))
-                                            has_id = True
-                                            break
+    for entry in index:
+        if not entry.is_template and entry.full_name.startswith(namespace + "::") and entry.Inherits(CLASS_IUNKNOWN):
+            for iid in entry.ids:
+                interfaces.append(Interface(entry.obj, iid, source_file))
 
-                            if not has_id and not c.omit:
-                                log.Warn("class %s does not have an ID enumerator" % c.full_name, source_file)
+            if not entry.ids and not entry.obj.omit:
+                log.Warn("class %s does not have an ID enumerator" % entry.full_name, source_file)
 
-                __Traverse(c, interface_namespace, faces)
-
-        if isinstance(tree, CppParser.Namespace):
-            for n in tree.namespaces:
-                __Traverse(n, namespace, faces)
+    return interfaces, omit_interface_used
 
-    __Traverse(tree, namespace, interfaces)
 
-    return interfaces, omit_interface_used
+# Same as above, but takes the classes found by a quick scan of the file instead of its parsed tree (see --list-outputs)
+def FindScannedInterfaceClasses(classes, namespace):
+    return [c for c in classes if not c.is_template and c.full_name.startswith(namespace + "::") and c.Inherits(CLASS_IUNKNOWN) and c.has_id]
 
 
 # Cut out scope resolution operators from all identifiers found in a string
@@ -524,7 +512,7 @@ def GenerateLuaData(emit, interfaces_list, enums_list, source_file=None, tree=No
         emit.Line("}")
         emit.Line()
 
-def Parse(source_file, framework_namespace, includePaths = [], defaults = "", extra_includes = []):
+def Parse(source_file, framework_namespace, includePaths = [], defaults = "", extra_includes = [], dependencies = None):
 
     log.Info("Parsing %s..." % source_file)
 
@@ -536,16 +524,75 @@ def Parse(source_file, framework_namespace, includePaths = [], defaults = "", ex
     files.extend(extra_includes)
     files.append(source_file)
 
-    tree = CppParser.ParseFiles(files, framework_namespace, includePaths, log)
+    tree = CppParser.ParseFiles(files, framework_namespace, includePaths, log, dependencies)
     if not isinstance(tree, CppParser.Namespace):
         raise SkipFileError(source_file)
 
     return tree
 
-def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
+def PartitionFileName(output_file, interface_name):
+    # The file holding the code of a single interface (see --per-interface)
+    return os.path.splitext(output_file)[0] + "_" + CreateName(interface_name) + ".cpp"
+
+def GenerateRegistration(emit, names, declare=True):
+    # Registers the interfaces announced by functions emitted elsewhere (see --per-interface and --unity);
+    # the functions are declared unless these were emitted earlier in the same file
+    emit.Line("namespace %s {" % STUB_NAMESPACE.split("::")[-2])
+    emit.Line()
+    emit.Line("namespace %s {" % STUB_NAMESPACE.split("::")[-1])
+    emit.Line()
+    emit.IndentInc()
+
+    emit.Line("// -----------------------------------------------------------------")
+    emit.Line("// REGISTRATION")
+    emit.Line("// -----------------------------------------------------------------")
+
+    for name in (names if declare else []):
+        emit.Line("void Announce%s();" % name)
+        emit.Line("void Recall%s();" % name)
+
+    emit.Line()
+    emit.Line("namespace {")
+    emit.IndentInc()
+    emit.Line()
+    emit.Line("static class Instantiation {")
+    emit.Line("public:")
+    emit.IndentInc()
+    emit.Line("Instantiation()")
+    emit.Line("{")
+    emit.IndentInc()
+
+    for name in names:
+        emit.Line("Announce%s();" % name)
+
+    emit.IndentDec()
+    emit.Line("}")
+    emit.Line("~Instantiation()")
+    emit.Line("{")
+    emit.IndentInc()
+
+    for name in names:
+        emit.Line("Recall%s();" % name)
+
+    emit.IndentDec()
+    emit.Line("}")
+    emit.IndentDec()
+    emit.Line("} ProxyStubRegistration;")
+    emit.Line()
+    emit.IndentDec()
+    emit.Line("} // namespace")
+    emit.Line()
+    emit.IndentDec()
+    emit.Line("} // namespace %s" % STUB_NAMESPACE.split("::")[-1])
+    emit.Line()
+    emit.Line("}")
+
+def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False, unity=None):
+    # With unity (a list of the interfaces emitted so far) the code is appended to output_file, while
+    # the registration is left to the caller (see GenerateRegistration)
     log.Info("Scanning '%s' (in %s)..." % (source_file, ns))
 
-    if not FORCE and (os.path.exists(output_file) and (os.path.getmtime(source_file) < os.path.getmtime(output_file))):
+    if not scan_only and (unity == None) and not FORCE and (os.path.exists(output_file) and (os.path.getmtime(source_file) < os.path.getmtime(output_file))):
         raise NotModifiedException(output_file)
 
     interfaces, omit_interface_used = FindInterfaceClasses(tree, ns)
@@ -559,7 +606,7 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
 
     interface_namespace = ns.split("::")[-1]
 
-    with open(output_file, "w") as file:
+    with open(output_file, "w" if unity == None else "a") as file:
         emit = Emitter(file, INDENT_SIZE)
 
         announce_list = OrderedDict()
@@ -573,7 +620,8 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
                  "result": "result",
                  "interface": "interface",
                  "hresult": "hresult",
-                 "tempbuffer": "tempBuffer"
+                 "tempbuffer": "tempBuffer",
+                 "framesize": "frameSize"
                 }
 
         class AuxIdentifier():
@@ -1233,8 +1281,43 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
 
             return retval, params, input_params, output_params, proxy_params, return_proxy_params
 
-        def CheckFrame(p, by_parameter=False):
+        # Parameters already covered by a frame size check of the whole fixed-size run they belong to,
+        # and the strings and buffers with the size of the fixed-size run following them
+        prechecked_params = []
+        trailing_runs = []
+
+        def CheckFixedFrame(params):
+            # Validates the frame once per run of fixed-size parameters, using sizes computed at compile time:
+            # the leading run is checked upfront, any other run along with the string or buffer preceding it
+            # (once its length is known)
             if ENABLE_INTEGRITY_VERIFICATION:
+                runs = [[None, []]] # [preceding string or buffer (None for the leading run), fixed-size parameters]
+
+                for p in params:
+                    if not p or not p.is_on_wire:
+                        continue
+                    elif p.optional or p.is_array or p.is_compound or p.return_proxy:
+                        # The size of these depends on more than a length, so they end a run
+                        runs.append([False, []])
+                    elif p.is_buffer or p.is_string:
+                        runs.append([p, []])
+                    else:
+                        runs[-1][1].append(p)
+
+                for preceding, fixed in runs:
+                    if fixed:
+                        size = " + ".join([p.storage_size for p in fixed])
+
+                        if preceding:
+                            trailing_runs.append((preceding, size))
+                            prechecked_params.extend(fixed)
+                        elif (preceding == None) and (len(fixed) > 1):
+                            emit.Line("constexpr uint32_t %s = (%s);" % (vars["framesize"], size))
+                            emit.Line("if (%s.Length() < %s) { return (COM_ERROR | Core::ERROR_READ_ERROR); }" % (vars["reader"], vars["framesize"]))
+                            prechecked_params.extend(fixed)
+
+        def CheckFrame(p, by_parameter=False):
+            if ENABLE_INTEGRITY_VERIFICATION and not [x for x in prechecked_params if x is p]:
                 emit.Line("if (%s.Length() < (%s)) { return (COM_ERROR | Core::ERROR_READ_ERROR); }" % \
                             (vars["reader"], (p.as_rvalue if by_parameter else p.storage_size)))
 
@@ -1253,8 +1336,10 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
             if ENABLE_INTEGRITY_VERIFICATION:
                 emit.Line("%s = %s.PeekNumber<%s>();" % (p.peek_length.temporary, vars["reader"], p.peek_length.type_name))
                 CheckRange(p, p.peek_length)
-                emit.Line("if (%s.Length() < (static_cast<uint32_t>(%s) + %s)) { return (COM_ERROR | Core::ERROR_READ_ERROR); }" % \
-                            (vars["reader"], p.storage_size, p.peek_length.as_rvalue))
+                trailing = [size for x, size in trailing_runs if x is p]
+
+                emit.Line("if (%s.Length() < (static_cast<uint32_t>(%s) + %s%s)) { return (COM_ERROR | Core::ERROR_READ_ERROR); }" % \
+                            (vars["reader"], p.storage_size, p.peek_length.as_rvalue, (" + " + trailing[0]) if trailing else ""))
             else:
                 CheckRange(p, "%s.PeekNumber<%s>()" % (vars["reader"], p.peek_length.type_name))
 
@@ -1298,7 +1383,6 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
             has_restricted_parameters = any([v.restrict_range for v in input_params])
 
             output_buffers = []
-            custom_buffers = []
             has_hresult = retval and retval.is_hresult
 
             # For stubs
@@ -1408,14 +1492,27 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
                 if has_same_buffer:
                     return
 
-                # May need to allocate custom memory to pass large buffer
                 has_large_buffer_size = (p.max_length and (p.max_length.type.Type().size == "long"))
-                has_large_buffer = (has_large_buffer_size and ENABLE_CUSTOM_ALLOCATOR)
                 has_buffer_reuse = (p.is_input and p.max_length and p.length and (p.max_length != p.length))
 
-                if has_large_buffer:
-                    large_buffer = AuxIdentifier(CppParser.Void(), CppParser.Ref.POINTER, (p.name[1:] + "Custom"))
-                    emit.Line("%s{};" % large_buffer.temporary_no_cv)
+                # Large buffers may be taken from the administrator instead of the stack (see --stack-threshold),
+                # if the @restrict range tells on which side of the threshold the buffer is no check is needed
+                on_stack = True
+                on_heap = False
+
+                if STACK_BUFFER_THRESHOLD != None:
+                    if p.restrict_range and (p.restrict_range[1] <= STACK_BUFFER_THRESHOLD):
+                        pass
+                    elif p.restrict_range and (p.restrict_range[0] > STACK_BUFFER_THRESHOLD):
+                        on_stack = False
+                        on_heap = True
+                    else:
+                        on_heap = True
+
+                if on_heap:
+                    # Released on any way out of the stub method
+                    heap_buffer = Normalize(p.name[1:] + "Heap")
+                    emit.Line("std::unique_ptr<void, void(*)(void*)> %s(nullptr, [](void* buffer) { RPC::Administrator::Instance().Free(buffer); });" % heap_buffer)
 
                 emit.Line("if (%s != 0) {" % p.max_length.as_rvalue)
                 emit.IndentInc()
@@ -1430,42 +1527,58 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
                     emit.Line("%s{};" % temp_buffer.temporary_no_cv)
                     emit.Line()
 
-                if has_large_buffer:
-                    custom_buffers.append([p, large_buffer])
-                    emit.Line("%s = RPC::Administrator::Instance().Allocate(%s);" % (large_buffer.as_rvalue, p.max_length.as_rvalue))
-                    emit.Line()
-                    emit.Line("if (%s == nullptr) {" % large_buffer.as_rvalue)
-                    emit.IndentInc()
+                buffer = (p.as_rvalue if not has_buffer_reuse else temp_buffer.as_rvalue)
 
-                if has_large_buffer or (not ENABLE_CUSTOM_ALLOCATOR and has_large_buffer_size):
+                # The cap applies wherever the buffer comes from
+                if has_large_buffer_size:
                     emit.Line("ASSERT(%s <= 0x1000000);" % p.max_length.as_rvalue)
 
                     if ENABLE_RANGE_VERIFICATION:
                         emit.Line("if (%s > 0x1000000) { return (Core::ERROR_BAD_REQUEST); }" % p.max_length.as_rvalue)
                         emit.Line()
 
-                if EMIT_TRACES:
-                    emit.Line('fprintf(stderr, "*** Allocating %%u bytes on stack for a temporary buffer\\n", %s);' % p.max_length.as_rvalue)
+                if on_heap and on_stack:
+                    emit.Line("if (%s > %s) {" % (p.max_length.as_rvalue, STACK_BUFFER_THRESHOLD))
+                    emit.IndentInc()
 
-                emit.Line("%s = static_cast<%s>(ALLOCA(%s));" % \
-                    ((p.as_rvalue if not has_buffer_reuse else temp_buffer.as_rvalue), p.proto, p.max_length.as_rvalue))
+                if on_heap:
+                    if EMIT_TRACES:
+                        emit.Line('fprintf(stderr, "*** Allocating %%u bytes from the administrator for a temporary buffer\\n", %s);' % p.max_length.as_rvalue)
 
-                if has_large_buffer:
-                    emit.IndentDec()
-                    emit.Line("} else if (static_cast<uintptr_t>(%s) == ~0) {" % p.as_rvalue)
-                    emit.IndentInc()
-                    emit.Line("%s = nullptr;" % large_buffer.as_rvalue)
+                    emit.Line("%s.reset(RPC::Administrator::Instance().Allocate(%s));" % (heap_buffer, p.max_length.as_rvalue))
+
+                    if ENABLE_SECURE:
+                        emit.Line("if (%s == nullptr) { return (COM_ERROR | Core::ERROR_GENERAL); }" % heap_buffer)
+                        emit.Line("%s = static_cast<%s>(%s.get());" % (buffer, p.proto, heap_buffer))
+                    else:
+                        # The call can't be failed here, so fall back to the stack (as without the threshold)
+                        emit.Line("if (%s != nullptr) {" % heap_buffer)
+                        emit.IndentInc()
+                        emit.Line("%s = static_cast<%s>(%s.get());" % (buffer, p.proto, heap_buffer))
+                        emit.IndentDec()
+                        emit.Line("} else {")
+                        emit.IndentInc()
+                        emit.Line("%s = static_cast<%s>(ALLOCA(%s));" % (buffer, p.proto, p.max_length.as_rvalue))
+                        emit.IndentDec()
+                        emit.Line("}")
+
+                if on_heap and on_stack:
                     emit.IndentDec()
                     emit.Line("} else {")
                     emit.IndentInc()
-                    emit.Line("%s = %s;" % (p.as_rvalue if not has_buffer_reuse else temp_buffer.as_rvalue, large_buffer.as_rvalue))
+
+                if on_stack:
+                    if EMIT_TRACES:
+                        emit.Line('fprintf(stderr, "*** Allocating %%u bytes on stack for a temporary buffer\\n", %s);' % p.max_length.as_rvalue)
+
+                    emit.Line("%s = static_cast<%s>(ALLOCA(%s));" % (buffer, p.proto, p.max_length.as_rvalue))
+
+                if on_heap and on_stack:
                     emit.IndentDec()
                     emit.Line("}")
-                    emit.Line()
 
                 if has_buffer_reuse:
-                    if not has_large_buffer:
-                        emit.Line()
+                    emit.Line()
 
                     emit.Line("if (%s != nullptr) {" % temp_buffer.as_rvalue)
                     emit.IndentInc()
@@ -1491,11 +1604,6 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
                 emit.IndentDec()
                 emit.Line("}")
 
-            def ReleaseBuffer(p, large_buffer):
-                assert p.is_buffer
-                if (p.max_length and (p.length.type.Type().size == "long")):
-                    emit.Line("RPC::Administrator::Instance().Free(%s);" % large_buffer.as_rvalue)
-
             def WriteParameter(p, no_array=False):
                 assert p
 
@@ -1620,6 +1728,8 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
 
             if input_params:
                 emit.Line("RPC::Data::Frame::Reader %s(%s->Parameters().Reader());" % (vars["reader"], vars["message"]))
+                CheckFixedFrame(input_params)
+
                 for p in input_params:
                     ReadParameter(p)
 
@@ -1655,11 +1765,6 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
                     if p:
                         WriteParameter(p)
 
-            if custom_buffers:
-                emit.Line()
-                for p in custom_buffers:
-                    ReleaseBuffer(p[0], p[1])
-
             if proxy_params:
                 emit.Line()
                 for p in proxy_params:
@@ -1954,6 +2059,8 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
                     emit.IndentInc()
 
                 if len(output_params) > _first_param:
+                    CheckFixedFrame(output_params[_first_param:])
+
                     for p in output_params[_first_param:]:
                         if p:
                             ReadParameter(p)
@@ -2144,81 +2251,197 @@ def GenerateStubs2(output_file, source_file, tree, ns, scan_only=False):
             emit.Line()
 
 
-        emit.Line("//")
-        emit.Line("// generated automatically from \"%s\"" % interface_header_name)
-        emit.Line("//")
-        emit.Line("// implements COM-RPC proxy stubs for:")
-
-        for face in interfaces:
-            if not face.obj.omit:
-                emit.Line("//   - %s" % Flatten(str(face.obj), ns))
+        def EmitPrologue(faces):
+            emit.Line("//")
+            emit.Line("// generated automatically from \"%s\"" % interface_header_name)
+            emit.Line("//")
+            emit.Line("// implements COM-RPC proxy stubs for:")
 
-        emit.Line("//")
+            for face in faces:
+                if not face.obj.omit:
+                    emit.Line("//   - %s" % Flatten(str(face.obj), ns))
 
-        if ENABLE_SECURE:
-            emit.Line("// secure code enabled:")
-            if ENABLE_INSTANCE_VERIFICATION:
-                emit.Line("//   - instance verification enabled")
-            if ENABLE_RANGE_VERIFICATION:
-                emit.Line("//   - range verification enabled")
-            if ENABLE_INTEGRITY_VERIFICATION:
-                emit.Line("//   - frame coherency verification enabled")
             emit.Line("//")
 
-        emit.Line()
+            if ENABLE_SECURE:
+                emit.Line("// secure code enabled:")
+                if ENABLE_INSTANCE_VERIFICATION:
+                    emit.Line("//   - instance verification enabled")
+                if ENABLE_RANGE_VERIFICATION:
+                    emit.Line("//   - range verification enabled")
+                if ENABLE_INTEGRITY_VERIFICATION:
+                    emit.Line("//   - frame coherency verification enabled")
+                emit.Line("//")
 
-        if os.path.isfile(os.path.join(os.path.dirname(source_file), "Module.h")):
-            emit.Line('#include "Module.h"')
+            emit.Line()
 
-        if os.path.isfile(os.path.join(os.path.dirname(source_file), interface_header_name)):
-            emit.Line('#include "%s"' % interface_header_name)
+            if os.path.isfile(os.path.join(os.path.dirname(source_file), "Module.h")):
+                emit.Line('#include "Module.h"')
 
-        emit.Line()
+            if os.path.isfile(os.path.join(os.path.dirname(source_file), interface_header_name)):
+                emit.Line('#include "%s"' % interface_header_name)
 
-        emit.Line('#include <com/com.h>')
-        emit.Line()
+            emit.Line()
 
-        emit.Line("namespace %s {" % STUB_NAMESPACE.split("::")[-2])
-        emit.Line()
-        emit.Line("namespace %s {" % STUB_NAMESPACE.split("::")[-1])
-        emit.Line()
-        emit.IndentInc()
+            emit.Line('#include <com/com.h>')
+            emit.Line()
 
-        if (interface_namespace != STUB_NAMESPACE.split("::")[-2]):
-            emit.Line("using namespace %s;" % interface_namespace)
+            emit.Line("namespace %s {" % STUB_NAMESPACE.split("::")[-2])
+            emit.Line()
+            emit.Line("namespace %s {" % STUB_NAMESPACE.split("::")[-1])
             emit.Line()
+            emit.IndentInc()
 
-        emit.Line("PUSH_WARNING(DISABLE_WARNING_DEPRECATED_USE)")
-        emit.Line("PUSH_WARNING(DISABLE_WARNING_TYPE_LIMITS)")
-        emit.Line()
+            if (interface_namespace != STUB_NAMESPACE.split("::")[-2]):
+                emit.Line("using namespace %s;" % interface_namespace)
+                emit.Line()
 
-        emit.Line("// -----------------------------------------------------------------")
-        emit.Line("// STUBS")
-        emit.Line("// -----------------------------------------------------------------\n")
+        def EmitCode(announce_list):
+            emit.Line("PUSH_WARNING(DISABLE_WARNING_DEPRECATED_USE)")
+            emit.Line("PUSH_WARNING(DISABLE_WARNING_TYPE_LIMITS)")
+            emit.Line()
 
-        for name, element in announce_list.items():
-            EmitStub(name, element[0], element[1], element[4], element[5])
+            emit.Line("// -----------------------------------------------------------------")
+            emit.Line("// STUBS")
+            emit.Line("// -----------------------------------------------------------------\n")
 
-        emit.Line("// -----------------------------------------------------------------")
-        emit.Line("// PROXIES")
-        emit.Line("// -----------------------------------------------------------------\n")
+            for name, element in announce_list.items():
+                EmitStub(name, element[0], element[1], element[4], element[5])
 
-        for name, [methods, _, _, proxy_name, interface, prepared_params] in announce_list.items():
-            EmitProxy(name, methods, proxy_name, interface, prepared_params)
+            emit.Line("// -----------------------------------------------------------------")
+            emit.Line("// PROXIES")
+            emit.Line("// -----------------------------------------------------------------\n")
 
-        emit.Line("POP_WARNING()")
-        emit.Line("POP_WARNING()")
-        emit.Line()
+            for name, [methods, _, _, proxy_name, interface, prepared_params] in announce_list.items():
+                EmitProxy(name, methods, proxy_name, interface, prepared_params)
 
-        emit.Line("// -----------------------------------------------------------------")
-        emit.Line("// REGISTRATION")
-        emit.Line("// -----------------------------------------------------------------")
-        EmitRegistration(announce_list)
+            emit.Line("POP_WARNING()")
+            emit.Line("POP_WARNING()")
+            emit.Line()
 
-        emit.IndentDec()
-        emit.Line("} // namespace %s" % STUB_NAMESPACE.split("::")[-1])
-        emit.Line()
-        emit.Line("}")
+        def EmitEpilogue():
+            emit.IndentDec()
+            emit.Line("} // namespace %s" % STUB_NAMESPACE.split("::")[-1])
+            emit.Line()
+            emit.Line("}")
+
+        if PER_INTERFACE_FILES or (unity != None):
+            # Each interface is announced by its own function, called from the registration code
+            # emitted separately (see GenerateRegistration); with a file per interface these have external linkage,
+            # so the names carry the header's name, as several headers may need the same template instance (e.g. an iterator),
+            # while in the unity file these are kept local, like the registration code of a single header
+            announce_prefix = (CreateName(interface_header_name).split(".", 1)[0] + "_") if unity == None else ""
+            linkage = "static " if unity != None else ""
+
+            def EmitAnnounceFunctions(announce_list):
+                emit.Line("// -----------------------------------------------------------------")
+                emit.Line("// REGISTRATION")
+                emit.Line("// -----------------------------------------------------------------")
+                emit.Line("namespace {")
+                emit.IndentInc()
+                emit.Line()
+
+                for _, [_, methods, stub, _, interface, _ ] in announce_list.items():
+                    emit.Line("typedef ProxyStub::UnknownStubType<%s, %s> %s;" % (Flatten(interface.obj.type, ns), methods, stub))
+
+                emit.Line()
+                emit.IndentDec()
+                emit.Line("} // namespace")
+                emit.Line()
+
+                for name, [_, _, stub, proxy, interface, _ ] in announce_list.items():
+                    emit.Line("%svoid Announce%s%s()" % (linkage, announce_prefix, CreateName(name)))
+                    emit.Line("{")
+                    emit.IndentInc()
+
+                    if EMIT_TRACES:
+                        emit.Line("fprintf(stderr, \"*** Announcing %s interface methods...\\n\");" % Flatten(interface.obj.type, ns))
+
+                    emit.Line("RPC::Administrator::Instance().Announce<%s, %s, %s>();" % (Flatten(interface.obj.type, ns), proxy, stub))
+                    emit.IndentDec()
+                    emit.Line("}")
+                    emit.Line()
+                    emit.Line("%svoid Recall%s%s()" % (linkage, announce_prefix, CreateName(name)))
+                    emit.Line("{")
+                    emit.IndentInc()
+
+                    if EMIT_TRACES:
+                        emit.Line("fprintf(stderr, \"*** Recalling %s interface methods...\\n\");" % Flatten(interface.obj.type, ns))
+
+                    emit.Line("RPC::Administrator::Instance().Recall<%s>();" % (Flatten(interface.obj.type, ns)))
+                    emit.IndentDec()
+                    emit.Line("}")
+                    emit.Line()
+
+            if unity != None:
+                # All the headers go into one file, so leave out what an earlier header already brought in
+                for name in [name for name in announce_list if CreateName(name) in unity]:
+                    log.Info("interface %s already emitted" % name)
+                    del announce_list[name]
+
+                if announce_list:
+                    EmitPrologue([face for face in interfaces if Flatten(face.obj.full_name, ns) in announce_list])
+                    EmitCode(announce_list)
+                    EmitAnnounceFunctions(announce_list)
+                    EmitEpilogue()
+                    emit.Line()
+
+                    unity.extend([CreateName(name) for name in announce_list])
+            else:
+                # Template instances (e.g. iterators) are not declared in the header, so their code is kept in the
+                # registration file rather than in files of their own: the files written can be told from a scan then
+                instances = OrderedDict([(name, element) for name, element in announce_list.items() \
+                                            if isinstance(element[4].obj, CppParser.InstantiatedTemplateClass)])
+
+                for name, element in announce_list.items():
+                    if name not in instances:
+                        with open(PartitionFileName(output_file, name), "w") as part_file:
+                            emit = Emitter(part_file, INDENT_SIZE)
+                            EmitPrologue([element[4]])
+                            EmitCode(OrderedDict([(name, element)]))
+                            EmitAnnounceFunctions(OrderedDict([(name, element)]))
+                            EmitEpilogue()
+
+                # ...and the small translation unit registering them all
+                emit = Emitter(file, INDENT_SIZE)
+
+                if instances:
+                    EmitPrologue([element[4] for element in instances.values()])
+                    EmitCode(instances)
+                    EmitAnnounceFunctions(instances)
+                    EmitEpilogue()
+                    emit.Line()
+
+                emit.Line("//")
+                emit.Line("// generated automatically from \"%s\"" % interface_header_name)
+                emit.Line("//")
+                emit.Line("// registers COM-RPC proxy stubs for:")
+
+                for name in announce_list:
+                    emit.Line("//   - %s (%s)" % (name, ("see " + os.path.basename(PartitionFileName(output_file, name))) if name not in instances else "above"))
+
+                emit.Line("//")
+                emit.Line()
+
+                if not instances:
+                    if os.path.isfile(os.path.join(os.path.dirname(source_file), "Module.h")):
+                        emit.Line('#include "Module.h"')
+                        emit.Line()
+
+                    emit.Line('#include <com/com.h>')
+                    emit.Line()
+
+                GenerateRegistration(emit, [(announce_prefix + CreateName(name)) for name in announce_list])
+        else:
+            EmitPrologue(interfaces)
+            EmitCode(announce_list)
+
+            emit.Line("// -----------------------------------------------------------------")
+            emit.Line("// REGISTRATION")
+            emit.Line("// -----------------------------------------------------------------")
+            EmitRegistration(announce_list)
+
+            EmitEpilogue()
 
     return interfaces, omit_interface_used
 
@@ -2343,6 +2566,41 @@ if __name__ == "__main__":
                            action="store_true",
                            default=FORCE,
                            help="force stub generation even if destination file is up-to-date (default: force disabled)")
+    argparser.add_argument("--watch",
+                           dest="watch",
+                           action="store_true",
+                           default=False,
+                           help="keep running and regenerate the stub code whenever an interface file (or a file it includes) changes; not supported with --lua-code")
+    argparser.add_argument("--stack-threshold",
+                           dest="stack_threshold",
+                           metavar="BYTES",
+                           type=int,
+                           action="store",
+                           default=None,
+                           help="allocate temporary buffers larger than BYTES with RPC::Administrator::Allocate() instead of on stack; the choice is made at generation time if @restrict range of the buffer permits (default: always allocate on stack)")
+    partition_group = argparser.add_mutually_exclusive_group()
+    partition_group.add_argument("--per-interface",
+                           dest="per_interface",
+                           action="store_true",
+                           default=False,
+                           help="emit the code of each interface into a file of its own (ProxyStubs_<name>_<interface>.cpp), next to a small file registering them (default: one file per interface header)")
+    partition_group.add_argument("--unity",
+                           dest="unity",
+                           metavar="NAME",
+                           action="store",
+                           default=None,
+                           help="emit the code of all interface headers into a single file (ProxyStubs_<NAME>.cpp); not supported with --watch (default: one file per interface header)")
+    argparser.add_argument("--list-outputs",
+                           dest="list_outputs",
+                           action="store_true",
+                           default=False,
+                           help="only print the names of the files that would be generated, one per line, without generating them")
+    argparser.add_argument("--cache-dir",
+                           dest="cache_dir",
+                           metavar="DIR",
+                           action="store",
+                           default=os.environ.get(Cache.CACHE_DIR_ENV),
+                           help="reuse stub code generated from identical inputs and options, kept in a cache directory shared between build trees (default: %s environment variable if set, otherwise no cache)" % Cache.CACHE_DIR_ENV)
     argparser.add_argument("-i",
                            dest="extra_includes",
                            metavar="FILE",
@@ -2361,9 +2619,11 @@ if __name__ == "__main__":
     ENABLE_INTEGRITY_VERIFICATION = args.integrity
     ENABLE_SECURE = ENABLE_INSTANCE_VERIFICATION or ENABLE_RANGE_VERIFICATION or ENABLE_INTEGRITY_VERIFICATION
     log.show_infos = BE_VERBOSE
-    log.show_warnings = SHOW_WARNINGS
+    log.show_warnings = SHOW_WARNINGS and not args.list_outputs
     OUTDIR = args.outdir
     EMIT_TRACES = args.traces
+    PER_INTERFACE_FILES = args.per_interface
+    STACK_BUFFER_THRESHOLD = args.stack_threshold
     scan_only = False
     keep_incomplete = args.keep_incomplete
 
@@ -2474,7 +2734,60 @@ if __name__ == "__main__":
         faces = []
         skipped = []
 
-        if interface_files:
+        cache = None
+
+        # The cache keeps one output per interface file
+        if args.cache_dir and args.code and not args.lua_code and not args.per_interface and not args.unity:
+            # Options not affecting the content of the stub code are not a part of the key; include paths only matter
+            # through the files found (or not) in them, and of the extra includes only their order matters besides their contents
+            roots = dict([("includePaths%i" % i, d) for i, d in enumerate(args.includePaths)])
+            roots.update([("extra_includes%i" % i, os.path.dirname(f)) for i, f in enumerate(args.extra_includes)])
+
+            options = { k: v for k, v in vars(args).items() if k not in ["path", "outdir", "force", "verbose", "keep_incomplete", "noidentify", "cache_dir", "watch", "list_outputs", "includePaths"] }
+            options["extra_includes"] = [os.path.basename(f) for f in args.extra_includes]
+
+            cache = Cache.Cache(args.cache_dir, log, [os.path.dirname(os.path.abspath(__file__))], options, roots)
+
+        if interface_files and args.list_outputs:
+            # Only tell the files that would be generated (e.g. to declare the outputs in a build system),
+            # the interface files are just scanned for the interfaces they hold, not parsed
+            if args.code and not args.noidentify:
+                print(os.path.join(os.path.dirname(interface_files[0]) if not OUTDIR else OUTDIR, "ProxyStubsMetadata.cpp"))
+
+            unity_listed = False
+
+            for source_file in interface_files:
+                output_file = os.path.join(os.path.dirname(source_file) if not OUTDIR else OUTDIR,
+                    PROXYSTUB_CPP_NAME % (CreateName(os.path.basename(source_file)).split(".", 1)[0] if not args.unity else args.unity))
+
+                try:
+                    if args.code:
+                        classes = Scanner.Scan(source_file, FRAMEWORK_NAMESPACE)
+
+                        for ns in INTERFACE_NAMESPACES:
+                            faces = FindScannedInterfaceClasses(classes, ns)
+
+                            # The interfaces the code is emitted for, each in a file of its own with --per-interface
+                            names = [Flatten(face.full_name, ns) for face in faces if not face.omit and face.methods]
+
+                            if args.unity:
+                                if not unity_listed and names:
+                                    print(output_file)
+                                    unity_listed = True
+                            elif faces:
+                                print(output_file)
+
+                                if args.per_interface:
+                                    for name in names:
+                                        print(PartitionFileName(output_file, name))
+
+                except IOError as err:
+                    log.Error(err)
+
+            if args.lua_code:
+                print(os.path.join("." if not OUTDIR else OUTDIR, "protocol-thunder-comrpc.data"))
+
+        elif interface_files:
             if args.lua_code:
                 name = "protocol-thunder-comrpc.data"
                 lua_file = open(("." if not OUTDIR else OUTDIR) + os.sep + name, "w")
@@ -2491,68 +2804,155 @@ if __name__ == "__main__":
 
                 GenerateIdentification(output_file)
 
-            for source_file in interface_files:
-                try:
-                    _extra_includes = [ os.path.join("@" + os.path.dirname(source_file), IDS_DEFINITIONS_FILE) ]
-                    _extra_includes.extend(args.extra_includes)
+            inputs = dict() # files read for each of the interface files
+            pending = interface_files
+            watcher = None
+            unity = None # interfaces emitted into the unity file so far
 
-                    tree = Parse(source_file, FRAMEWORK_NAMESPACE, args.includePaths,
-                                    os.path.join("@" + os.path.dirname(os.path.realpath(__file__)), DEFAULT_DEFINITIONS_FILE),
-                                    _extra_includes)
+            if args.unity and args.code:
+                unity_file = os.path.join(os.path.dirname(interface_files[0]) if not OUTDIR else OUTDIR, PROXYSTUB_CPP_NAME % args.unity)
 
-                    if args.code:
-                        log.Header(source_file)
+                if not FORCE and not args.lua_code and os.path.exists(unity_file) \
+                        and (max([os.path.getmtime(f) for f in interface_files]) < os.path.getmtime(unity_file)):
+                    log.Info("skipped file %s, up-to-date" % os.path.basename(unity_file))
+                    skipped.extend(interface_files)
+                    pending = []
+                else:
+                    unity = []
+
+                    out_dir = os.path.dirname(unity_file)
+                    if not os.path.exists(out_dir):
+                        os.makedirs(out_dir)
+
+                    # The headers are appended one by one
+                    open(unity_file, "w").close()
+
+            while pending:
+                for source_file in pending:
+                    # Forget what was found in the file previously (in watch mode)
+                    faces = [f for f in faces if f.file != source_file]
 
+                    if source_file in skipped:
+                        skipped.remove(source_file)
+
+                    try:
                         output_file = os.path.join(os.path.dirname(source_file) if not OUTDIR else OUTDIR,
-                            PROXYSTUB_CPP_NAME % CreateName(os.path.basename(source_file)).split(".", 1)[0])
+                            PROXYSTUB_CPP_NAME % CreateName(os.path.basename(source_file)).split(".", 1)[0]) if unity == None else unity_file
 
-                        out_dir = os.path.dirname(output_file)
-                        if not os.path.exists(out_dir):
-                            os.makedirs(out_dir)
+                        if cache:
+                            log.Header(source_file)
 
-                        new_faces = []
-                        some_omitted = False
+                            cached = cache.Lookup(source_file, { "outdir": os.path.dirname(output_file) })
 
-                        for ns in INTERFACE_NAMESPACES:
-                            output, some_omitted = GenerateStubs2(output_file, source_file, tree, ns, scan_only)
+                            if cached:
+                                inputs[source_file] = cached[0]
 
-                            new_faces += output
+                                for warning in cached[2]:
+                                    log.warnings.append(warning)
+                                    print(warning)
 
-                        if not new_faces:
-                            if not some_omitted:
-                                raise NoInterfaceError
-                            else:
-                                log.Info("no interface classes found")
+                                log.Info("restored file %s from cache" % os.path.basename(output_file))
+                                continue
 
-                        else:
-                            faces += new_faces
-                            log.Info("created file %s" % os.path.basename(output_file))
+                        errors_before = len(log.errors)
+                        warnings_before = len(log.warnings)
 
-                        # dump interfaces if only scanning
-                        if scan_only:
-                            for f in sorted(output, key=lambda x: str(x.id)):
-                                print(f.id, f.obj.full_name)
+                        _extra_includes = [ os.path.join("@" + os.path.dirname(source_file), IDS_DEFINITIONS_FILE) ]
+                        _extra_includes.extend(args.extra_includes)
 
-                    if args.lua_code:
-                        log.Info("(lua generator) Scanning %s..." % os.path.basename(source_file))
+                        dependencies = []
+                        inputs[source_file] = dependencies
 
-                        for ns in INTERFACE_NAMESPACES:
-                            GenerateLuaData(Emitter(lua_file, INDENT_SIZE), lua_interfaces, lua_enums, source_file, tree, ns)
-
-                except NotModifiedException as err:
-                    log.Info("skipped file %s, up-to-date" % os.path.basename(output_file))
-                    skipped.append(source_file)
-                except SkipFileError as err:
-                    log.Print("skipped file %s" % os.path.basename(output_file))
-                    skipped.append(source_file)
-                except NoInterfaceError as err:
-                    log.Warn("no interface classes found")
-                except TypenameError as err:
-                    log.Error(err)
-                    if not keep_incomplete and os.path.isfile(output_file):
-                        os.remove(output_file)
-                except (CppParser.ParserError, CppParser.LoaderError) as err:
-                    log.Error(err)
+                        tree = Parse(source_file, FRAMEWORK_NAMESPACE, args.includePaths,
+                                        os.path.join("@" + os.path.dirname(os.path.realpath(__file__)), DEFAULT_DEFINITIONS_FILE),
+                                        _extra_includes, dependencies)
+
+                        if args.code:
+                            log.Header(source_file)
+
+                            out_dir = os.path.dirname(output_file)
+                            if not os.path.exists(out_dir):
+                                os.makedirs(out_dir)
+
+                            new_faces = []
+                            some_omitted = False
+
+                            for ns in INTERFACE_NAMESPACES:
+                                output, some_omitted = GenerateStubs2(output_file, source_file, tree, ns, scan_only, unity)
+
+                                new_faces += output
+
+                            if not new_faces:
+                                if not some_omitted:
+                                    raise NoInterfaceError
+                                else:
+                                    log.Info("no interface classes found")
+
+                            else:
+                                faces += new_faces
+                                log.Info("created file %s" % os.path.basename(output_file))
+
+                                # Failed runs are not cached, so that the errors are reported again
+                                if cache and (len(log.errors) == errors_before):
+                                    cache.Store(source_file, dependencies, [output_file], { "outdir": os.path.dirname(output_file) }, log.warnings[warnings_before:])
+
+                            # dump interfaces if only scanning
+                            if scan_only:
+                                for f in sorted(output, key=lambda x: str(x.id)):
+                                    print(f.id, f.obj.full_name)
+
+                        if args.lua_code:
+                            log.Info("(lua generator) Scanning %s..." % os.path.basename(source_file))
+
+                            for ns in INTERFACE_NAMESPACES:
+                                GenerateLuaData(Emitter(lua_file, INDENT_SIZE), lua_interfaces, lua_enums, source_file, tree, ns)
+
+                    except NotModifiedException as err:
+                        log.Info("skipped file %s, up-to-date" % os.path.basename(output_file))
+                        skipped.append(source_file)
+                    except SkipFileError as err:
+                        log.Print("skipped file %s" % os.path.basename(output_file))
+                        skipped.append(source_file)
+                    except NoInterfaceError as err:
+                        log.Warn("no interface classes found")
+                    except TypenameError as err:
+                        log.Error(err)
+                        if not keep_incomplete and os.path.isfile(output_file):
+                            os.remove(output_file)
+                    except (CppParser.ParserError, CppParser.LoaderError) as err:
+                        log.Error(err)
+
+                if args.watch and args.code and not args.lua_code and not args.unity:
+                    try:
+                        if not watcher:
+                            watcher = Watcher.Watcher(log)
+                            log.Print("watching for changes, press Ctrl+C to stop...")
+                        else:
+                            log.Print("regenerated %i file%s, %s" % (len(pending), "s" if len(pending) > 1 else "",
+                                        ("%i error%s" % (len(log.errors), "s" if len(log.errors) > 1 else "")) if log.errors else "no errors"))
+
+                        pending = []
+                        watched = dict([(f, (inputs.get(f) or [f])) for f in interface_files])
+                        changed = watcher.Wait(sum(watched.values(), []))
+                        pending = [f for f in interface_files if [d for d in watched[f] if os.path.abspath(d) in changed]]
+
+                        # Only the affected files are processed again, regardless of their timestamps
+                        FORCE = True
+                        log.errors.clear()
+                    except KeyboardInterrupt:
+                        pending = []
+                else:
+                    pending = []
+
+            if unity != None:
+                # Finally register all the interfaces, unless the file is incomplete
+                if unity and (not log.errors or keep_incomplete):
+                    with open(unity_file, "a") as file:
+                        GenerateRegistration(Emitter(file, INDENT_SIZE), unity, declare=False)
+
+                    log.Info("created file %s" % os.path.basename(unity_file))
+                elif os.path.isfile(unity_file):
+                    os.remove(unity_file)
 
             if args.code:
                 if scan_only:
@@ -2576,6 +2976,9 @@ if __name__ == "__main__":
                 if len(interface_files) > 1 and BE_VERBOSE:
                     print("")
 
+                if cache:
+                    log.Print("cache: %s" % cache.Statistics())
+
                 log.Info(("all done; %i file%s processed" %
                         (len(interface_files) - len(skipped), "s" if len(interface_files) - len(skipped) > 1 else "")) +
                         ((" (%i file%s skipped)" % (len(skipped), "s" if len(skipped) > 1 else "")) if skipped else "") +
@@ -0,0 +1,141 @@
+# If not stated otherwise in this file or this component's license file the
+# following copyright and licenses apply:
+#
+# Copyright 2020 Metrological
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+# Waits for changes of source files, for the --watch mode of the generators
+#
+
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+POLL_INTERVAL = 0.25 # seconds
+SETTLE_TIME = 0.05 # seconds, editors often write a file in several steps
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.directories = dict() # watch descriptor to directory
+
+    def Add(self, directory):
+        if directory not in self.directories.values():
+            wd = self.libc.inotify_add_watch(self.fd, directory.encode(), WATCH_MASK)
+
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed on %s" % directory)
+
+            self.directories[wd] = directory
+
+    def Read(self, timeout):
+        # Returns the paths touched since the last read, waits up to timeout seconds if there's nothing yet
+        paths = set()
+
+        if select.select([self.fd], [], [], timeout)[0]:
+            data = os.read(self.fd, 65536)
+            offset = 0
+
+            while offset < len(data):
+                wd, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0").decode()
+                offset += length
+
+                if wd in self.directories and name:
+                    paths.add(os.path.join(self.directories[wd], name))
+
+        return paths
+
+
+class Watcher:
+    def __init__(self, log):
+        self.log = log
+
+        try:
+            self.inotify = _Inotify()
+        except (OSError, AttributeError, TypeError) as err:
+            # Not Linux (or no inotify available), fall back to checking modification times
+            self.log.Info("inotify not available (%s), polling for changes" % err)
+            self.inotify = None
+
+    def Wait(self, files):
+        # Blocks until any of the files is modified (or created or removed); returns the ones that were
+        files = set([os.path.abspath(f) for f in files])
+
+        if self.inotify:
+            try:
+                for directory in set([os.path.dirname(f) for f in files]):
+                    self.inotify.Add(directory)
+            except OSError as err:
+                self.log.Info("%s, polling for changes" % err)
+                self.inotify = None
+
+        if self.inotify:
+            changed = set()
+
+            while not changed:
+                changed = (self.inotify.Read(None) & files)
+
+            while True:
+                touched = self.inotify.Read(SETTLE_TIME)
+
+                if not touched:
+                    break
+
+                changed |= (touched & files)
+
+            return changed
+
+        else:
+            def _Stamp(f):
+                try:
+                    stat = os.stat(f)
+                    return (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    return None
+
+            stamps = dict([(f, _Stamp(f)) for f in files])
+
+            while True:
+                time.sleep(POLL_INTERVAL)
+
+                changed = set([f for f in files if _Stamp(f) != stamps[f]])
+
+                if changed:
+                    time.sleep(SETTLE_TIME)
+                    return changed